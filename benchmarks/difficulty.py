@@ -0,0 +1,57 @@
+"""Compares the integer difficulty engine with the hex string functions it replaced.
+
+Usage:
+    python benchmarks/difficulty.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+
+import util
+import validate
+
+DIFFICULTY = util.difficultyStart()
+SHA = '00000000%s' % ('f' * 56)
+DURATION = util.difficultyDuration() / 2
+
+
+def string_meets_difficulty():
+    mask = util.unpack_bits(DIFFICULTY, True)
+    try:
+        validate.difficulty_unpacked(mask, len(mask) - len(mask.lstrip('0')), SHA)
+    except Exception:
+        pass
+
+
+def integer_meets_difficulty():
+    try:
+        validate.difficulty(DIFFICULTY, SHA, False)
+    except Exception:
+        pass
+
+
+def string_calculate_difficulty():
+    result = long(util.unpack_bits(DIFFICULTY), 16) * DURATION / util.difficultyDuration()
+    util.difficulty_from_hex(util.difficulty_from_target(hex(result)[2:]))
+
+
+def integer_calculate_difficulty():
+    util.pack_target(util.unpack_target(DIFFICULTY) * DURATION / util.difficultyDuration())
+
+
+def main():
+    iterations = int(sys.argv[1]) if 1 < len(sys.argv) else 100000
+    print('%24s %12s %12s' % ('operation', 'string (us)', 'integer (us)'))
+    for name, string_function, integer_function in [
+        ('meets difficulty', string_meets_difficulty, integer_meets_difficulty),
+        ('calculate difficulty', string_calculate_difficulty, integer_calculate_difficulty)
+    ]:
+        string_time = timeit.timeit(string_function, number=iterations)
+        integer_time = timeit.timeit(integer_function, number=iterations)
+        print('%24s %12.2f %12.2f' % (name, string_time * 1000000 / iterations, integer_time * 1000000 / iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Times the routes of the service against seeded chains, counting the SQL
+queries each request runs, and compares them to a committed baseline.
+
+Any route running more queries than the baseline, or getting slower than
+the baseline by more than the tolerance, is reported as a regression and
+the script exits with a non-zero status.
+
+Usage:
+    python benchmarks/endpoints.py [--heights 50,200] [--events 2,8] [--update]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DIFFICULTY_FUDGE'] = '8'
+os.environ['DB_HOST'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+
+import app as service
+import generator
+import serialize
+import util
+from models import database, count_queries
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SEED = 23
+REPEAT = 20
+POSTS = 5
+# Latency changes smaller than this are noise, whatever the tolerance.
+MINIMUM_MS = 2.0
+
+
+def measure(request, cold=False):
+    """Times a request, counting its queries.
+
+    Args:
+        request (function): Makes the request.
+        cold (bool): Empties the star log cache first, so serializing isn't skipped.
+
+    Returns:
+        tuple: Milliseconds elapsed, and the number of queries.
+    """
+    if cold:
+        serialize.star_log_cache.clear()
+    with count_queries() as counter:
+        start = time.time()
+        response = request()
+        elapsed = (time.time() - start) * 1000
+    if response.status_code != 200:
+        raise Exception('request failed with status %s' % response.status_code)
+    return elapsed, counter.count
+
+
+def summarize(measurements):
+    """Gets the median latency and query count of a set of measurements."""
+    latencies = sorted([latency for latency, _ in measurements])
+    queries = sorted([count for _, count in measurements])
+    return {'ms': round(latencies[len(latencies) // 2], 3), 'queries': queries[len(queries) // 2]}
+
+
+def run_case(client, keys, height, events):
+    """Seeds a chain, then measures each route against it.
+
+    Returns:
+        dict: Median latency and query count of each route, keyed by its name.
+    """
+    database.drop_all()
+    database.create_all()
+    chain_generator = generator.ChainGenerator(keys, SEED, events)
+    star_logs = [json.dumps(star_log) for star_log in chain_generator.generate(height + POSTS)]
+    session = database.session()
+    try:
+        generator.load(session, star_logs[:height])
+    finally:
+        session.close()
+
+    suffix = ' height=%s events=%s' % (height, events)
+    results = {}
+    gets = ['/chains?limit=1', '/chains?limit=10', '/star-logs?limit=1', '/star-logs?limit=10',
+            '/star-logs?limit=10&offset=10', '/star-logs?limit=10&offset=%s' % max(0, height - 10), '/events?limit=10']
+    for url in gets:
+        # Star logs are cached once serialized, so cold and warm requests are measured separately.
+        results['GET %s cold%s' % (url, suffix)] = summarize([measure(lambda: client.get(url), True) for _ in range(0, REPEAT)])
+        results['GET %s warm%s' % (url, suffix)] = summarize([measure(lambda: client.get(url)) for _ in range(0, REPEAT)])
+
+    posted = []
+    for body in star_logs[height:]:
+        posted.append(measure(lambda: client.post('/star-logs', data=body)))
+    results['POST /star-logs%s' % suffix] = summarize(posted)
+
+    posted = []
+    used = set()
+    while len(posted) < POSTS:
+        transfer = chain_generator.create_transfer(chain_generator.tip, used)
+        if transfer is None:
+            continue
+        fleet, event_type, inputs, outputs = transfer
+        used.update(inputs)
+        body = json.dumps(chain_generator.create_event(fleet, event_type, inputs, outputs, 0))
+        posted.append(measure(lambda: client.post('/events', data=body)))
+    results['POST /events%s' % suffix] = summarize(posted)
+    results['GET /events?limit=10 with pending%s' % suffix] = summarize([measure(lambda: client.get('/events?limit=10')) for _ in range(0, REPEAT)])
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Finds routes that got slower or run more queries than the baseline.
+
+    Returns:
+        list: Descriptions of each regression.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        current = results[name]
+        expected = baseline[name]
+        if expected['queries'] < current['queries']:
+            regressions.append('%s ran %s queries, baseline is %s' % (name, current['queries'], expected['queries']))
+        if expected['ms'] * (1.0 + tolerance) < current['ms'] and MINIMUM_MS < current['ms'] - expected['ms']:
+            regressions.append('%s took %.2f ms, baseline is %.2f ms' % (name, current['ms'], expected['ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the routes of the service against a baseline.')
+    parser.add_argument('--heights', default='50,200')
+    parser.add_argument('--events', default='2,8')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='fraction slower than the baseline allowed')
+    parser.add_argument('--keys', default=os.path.join(tempfile.gettempdir(), 'benchmark_keys.json'))
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update', action='store_true', help='writes the results as the new baseline')
+    args = parser.parse_args()
+
+    keys = generator.load_key_pool(args.keys, 8)
+    # Events are listed newest first, so the clock is frozen to keep which ones are listed, and their queries, the same between runs.
+    frozen_time = util.get_time()
+    util.get_time = lambda: frozen_time
+    client = service.app.test_client()
+    results = {}
+    for height in [int(value) for value in args.heights.split(',')]:
+        for events in [int(value) for value in args.events.split(',')]:
+            results.update(run_case(client, keys, height, events))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print('%-72s %10s %8s %10s %8s' % ('route', 'ms', 'queries', 'base ms', 'base q'))
+    for name in sorted(results):
+        expected = baseline.get(name, {})
+        print('%-72s %10.2f %8s %10s %8s' % (name, results[name]['ms'], results[name]['queries'], expected.get('ms', '-'), expected.get('queries', '-')))
+
+    if args.update:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print('baseline written to %s' % args.baseline)
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print('REGRESSION: %s' % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Compares hashing the events of a star log by concatenating strings
+against feeding a hasher incrementally.
+
+Usage:
+    python benchmarks/hashing.py [repeat]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+
+import util
+
+
+def string_hash_events(events):
+    concat = ''
+    for event in events:
+        concat += util.sha256(util.concat_event(event))
+    return util.sha256(concat)
+
+
+def create_events(count):
+    events = []
+    for index in range(0, count):
+        key = util.sha256('event%s' % index)
+        events.append({
+            'fleet_hash': util.sha256('fleet%s' % (index % 16)),
+            'fleet_key': key * 6,
+            'type': 'transfer',
+            'inputs': [{'index': i, 'key': util.sha256('%s%s' % (key, i))} for i in range(0, 2)],
+            'outputs': [{'index': i, 'type': 'transfer', 'fleet_hash': key, 'key': util.sha256('%s%s' % (i, key)), 'star_system': key, 'count': 10} for i in range(0, 2)]
+        })
+    return events
+
+
+def measure(function, events, repeat):
+    start = time.time()
+    for _ in range(0, repeat):
+        function(events)
+    return (time.time() - start) / repeat
+
+
+def main():
+    repeat = int(sys.argv[1]) if 1 < len(sys.argv) else 5
+    print('%10s %16s %16s' % ('events', 'string (ms)', 'streaming (ms)'))
+    for count in [1000, 2500, 5000, 10000]:
+        events = create_events(count)
+        if string_hash_events(events) != util.hash_events(events):
+            raise Exception('hashes of %s events do not match' % count)
+        print('%10s %16.2f %16.2f' % (count, measure(string_hash_events, events, repeat) * 1000, measure(util.hash_events, events, repeat) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Measures nearby system searches against the number of indexed systems.
+
+Usage:
+    python benchmarks/nearby.py [systems] [queries] [limit]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+
+import spatial
+import util
+
+
+def main():
+    count = int(sys.argv[1]) if 1 < len(sys.argv) else 300000
+    queries = int(sys.argv[2]) if 2 < len(sys.argv) else 1000
+    limit = int(sys.argv[3]) if 3 < len(sys.argv) else 10
+    grid_index = spatial.GridIndex()
+    start = time.time()
+    systems = [util.sha256('system %s' % i) for i in range(0, count)]
+    for system_hash in systems:
+        grid_index.add(system_hash)
+    print('indexed %s systems in %.2f s' % (count, time.time() - start))
+    for radius in [64.0, 256.0, util.jumpDistanceMaximum()]:
+        start = time.time()
+        for system_hash in systems[:queries]:
+            grid_index.nearby(system_hash, radius, limit)
+        print('radius %8.1f limit %4s: %.3f ms per query' % (radius, limit, (time.time() - start) * 1000 / queries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Measures POST /star-logs latency against chain height, with and without
+the lookup indices declared on the models.
+
+Usage:
+    python benchmarks/post_star_logs.py [height] [bucket]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DIFFICULTY_FUDGE'] = '8'
+os.environ['DB_HOST'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+
+import app as service
+import generator
+from models import database
+
+# Events in each star log, a reward followed by one spending ships rewarded earlier.
+EVENTS = 2
+
+
+def create_chain(height):
+    """Creates a chain with the generator, mined at the benchmark's difficulty."""
+    keys = generator.load_key_pool(os.path.join(tempfile.gettempdir(), 'benchmark_keys.json'), 1)
+    return list(generator.ChainGenerator(keys, 0, EVENTS).generate(height))
+
+
+def reset_database(indexed):
+    database.drop_all()
+    database.create_all()
+    if not indexed:
+        for table in database.metadata.tables.values():
+            for index in table.indexes:
+                index.drop(bind=database.engine)
+
+
+def run(star_logs, bucket):
+    client = service.app.test_client()
+    latencies = []
+    for star_log in star_logs:
+        body = json.dumps(star_log)
+        start = time.time()
+        response = client.post('/star-logs', data=body)
+        latencies.append(time.time() - start)
+        if response.status_code != 200:
+            raise Exception('star log at height %s was rejected' % len(latencies))
+    return [sum(latencies[i:i + bucket]) / len(latencies[i:i + bucket]) for i in range(0, len(latencies), bucket)]
+
+
+def main():
+    height = int(sys.argv[1]) if 1 < len(sys.argv) else 1000
+    bucket = int(sys.argv[2]) if 2 < len(sys.argv) else 100
+    star_logs = create_chain(height)
+    reset_database(False)
+    before = run(star_logs, bucket)
+    reset_database(True)
+    after = run(star_logs, bucket)
+    print('%10s %16s %16s' % ('height', 'unindexed (ms)', 'indexed (ms)'))
+    for i in range(0, len(before)):
+        print('%10s %16.2f %16.2f' % (i * bucket, before[i] * 1000, after[i] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import collections
+import threading
+
+
+class LruCache(object):
+    """A bounded, thread safe, least recently used cache.
+
+    Entries are evicted oldest first once the total size of the cached values
+    goes over the maximum. Without a sizer every entry counts as one, making
+    the maximum an entry count.
+
+    Args:
+        maximum (int): Largest total size of all cached values, zero disables
+        the cache.
+        sizer (function): Returns the size of a value being cached.
+    """
+
+    def __init__(self, maximum, sizer=None):
+        self.maximum = maximum
+        self.sizer = sizer
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Gets a cached value, marking it as the most recently used.
+
+        Args:
+            key: Key of the value.
+            default: Returned if the key is not cached.
+
+        Returns:
+            The cached value, or the default if it is missing.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Caches a value, evicting the least recently used ones if needed.
+
+        Args:
+            key: Key of the value.
+            value: Value to cache, values larger than the maximum are ignored.
+        """
+        size = 1 if self.sizer is None else self.sizer(value)
+        with self._lock:
+            existing = self._entries.pop(key, None)
+            if existing is not None:
+                self.size -= existing[1]
+            if self.maximum < size:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.maximum < self.size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted[1]
+                self.evictions += 1
+
+    def clear(self):
+        """Removes every cached value, leaving the counters intact."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+        """Gets the counters of this cache.
+
+        Returns:
+            dict: Hits, misses, evictions, entry count, size, maximum size,
+            and hit rate of the cache.
+        """
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'size': self.size,
+            'maximum': self.maximum,
+            'hit_rate': 0.0 if requests == 0 else float(self.hits) / requests
+        }
@@ -1,5 +1,4 @@
 from flask import Flask
-import os
 
 
 def create_app(extraArgs):
@@ -8,8 +7,34 @@ def create_app(extraArgs):
     for key, item in extraArgs.items():
         app.config[key] = item
 
+    import util
+    import metrics
+    import serialize
+    import signatures
+    import validate
     from models import database
 
+    # Rules are read from the environment once here, rather than on every request.
+    app.config['RULES'] = util.reload_rules()
+
     database.init_app(app)
 
+    metrics.register_cache('star_logs', serialize.star_log_cache)
+    metrics.register_cache('verified_events', signatures.verified_cache)
+    metrics.register_cache('public_keys', validate.public_key_cache)
+    metrics.register_cache('targets', util.target_cache)
+    metrics.register_cache('cartesians', util.cartesian_cache)
+
+    def get_pool_gauges():
+        pool = database.get_engine(app).pool
+        # Only queue pools keep connections open, the pools used for sqlite have nothing to report.
+        if not hasattr(pool, 'checkedout'):
+            return []
+        return [
+            ('cryptoverse_db_pool_size', {}, pool.size()),
+            ('cryptoverse_db_pool_checked_out', {}, pool.checkedout()),
+            ('cryptoverse_db_pool_overflow', {}, pool.overflow())
+        ]
+    metrics.register_gauges('db_pool', get_pool_gauges)
+
     return app
@@ -0,0 +1,377 @@
+"""Generates synthetic chains of star logs for load testing.
+
+Usage:
+    python project/generator.py generate [--star-logs N] [--events M] [--fleets F]
+        [--fork-rate R] [--fork-length L] [--seed S] [--keys PATH] > chain.ndjson
+    DB_HOST=sqlite:///service.db python project/generator.py load < chain.ndjson
+
+Star logs are printed one per line, parents before children, so the output
+can be posted to /star-logs/batch as application/x-ndjson or loaded straight
+into the database. Generating with a low DIFFICULTY_FUDGE keeps mining fast.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import miner
+import util
+
+# Fixed so the same seed always gives the same hashes.
+START_TIME = 1496510257
+
+
+def create_key():
+    """Generates an Rsa key for a fleet.
+
+    Returns:
+        dict: The stripped public key, and the private key with its BEGIN and END sections.
+    """
+    private_key = rsa.generate_private_key(65537, 2048, default_backend())
+    public_pem = private_key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    private_pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption())
+    return {
+        'public_key': ''.join(public_pem.strip().split('\n')[1:-1]),
+        'private_key': private_pem
+    }
+
+
+def load_key_pool(path, count):
+    """Loads Rsa keys from a pool file, generating and saving any more that are needed.
+
+    Args:
+        path (str): Json file holding the pool, created if it does not exist.
+        count (int): Number of keys needed.
+
+    Returns:
+        list: The first `count` keys of the pool.
+    """
+    keys = []
+    if os.path.exists(path):
+        with open(path) as pool_file:
+            keys = json.load(pool_file)
+    if len(keys) < count:
+        keys += [create_key() for _ in range(len(keys), count)]
+        with open(path, 'w') as pool_file:
+            json.dump(keys, pool_file)
+    return [(str(key['public_key']), str(key['private_key'])) for key in keys[:count]]
+
+
+class Tip(object):
+    """The head of a branch being generated, along with the ships on it that have not been used.
+
+    Unused outputs are kept in a list to pick from at random, and in a dict
+    holding their fleet, system, and count. Used keys are only removed from
+    the dict, and skipped when picked from the list.
+    """
+
+    def __init__(self):
+        self.star_log = None
+        self.height = -1
+        self.interval_start_time = None
+        self.keys = []
+        self.outputs = {}
+        self.systems = []
+        self.by_system = {}
+
+    def copy(self):
+        """Copies the tip, so a fork can be generated off of it without changing it.
+
+        Returns:
+            Tip: The copy.
+        """
+        tip = Tip()
+        tip.star_log = self.star_log
+        tip.height = self.height
+        tip.interval_start_time = self.interval_start_time
+        tip.keys = list(self.keys)
+        tip.outputs = dict(self.outputs)
+        tip.systems = list(self.systems)
+        tip.by_system = dict([(system, list(keys)) for system, keys in self.by_system.items()])
+        return tip
+
+    def add_output(self, key, fleet, system, count):
+        self.keys.append(key)
+        self.outputs[key] = (fleet, system, count)
+        self.by_system.setdefault(system, []).append(key)
+
+    def pick_output(self, generator, used):
+        """Picks an unused output at random.
+
+        Args:
+            generator (Random): Source of randomness.
+            used (set): Keys already used in the star log being generated.
+
+        Returns:
+            str: Key of the output, or None if none was found.
+        """
+        if len(self.outputs) * 2 < len(self.keys):
+            self.keys = [key for key in self.keys if key in self.outputs]
+        for _ in range(0, 8):
+            if not self.keys:
+                return None
+            key = self.keys[generator.randrange(len(self.keys))]
+            if key in self.outputs and key not in used:
+                return key
+        return None
+
+
+class ChainGenerator(object):
+    """Deterministically generates star logs and the events in them.
+
+    Everything is derived from the seed and the key pool, except for
+    signatures, which are salted and so differ between runs without changing
+    any hashes.
+
+    Args:
+        keys (list): Stripped public and private key of each fleet.
+        seed (int): Seed of every random choice.
+        events (int): Events to include in each star log, starting with a reward.
+        fork_rate (float): Chance of each star log having an abandoned fork branch off of it.
+        fork_length (int): Longest a fork grows before being abandoned.
+    """
+
+    def __init__(self, keys, seed=0, events=4, fork_rate=0.0, fork_length=1):
+        self.fleets = [{'hash': util.sha256(public_key), 'key': public_key, 'private': private_key} for public_key, private_key in keys]
+        self.seed = seed
+        self.generator = random.Random(seed)
+        self.events = events
+        self.fork_rate = fork_rate
+        self.fork_length = fork_length
+        self.key_count = 0
+        self.tip = None
+        self.spacing = max(1, util.difficultyDuration() // util.difficultyInterval())
+
+    def create_key(self):
+        self.key_count += 1
+        return util.sha256('generated %s %s' % (self.seed, self.key_count))
+
+    def create_event(self, fleet, event_type, inputs, outputs, index):
+        """Creates a signed event.
+
+        Args:
+            fleet (int): Index of the fleet signing the event.
+            event_type (str): Type of the event and its outputs.
+            inputs (list): Keys used by the event.
+            outputs (list): Fleet index, key, star system and count of each output.
+            index (int): Index of the event in its star log.
+
+        Returns:
+            dict: Json of the event.
+        """
+        event = {
+            'index': index,
+            'type': event_type,
+            'fleet_hash': self.fleets[fleet]['hash'],
+            'fleet_key': self.fleets[fleet]['key'],
+            'inputs': [{'index': i, 'key': key} for i, key in enumerate(inputs)],
+            'outputs': [
+                {
+                    'index': i,
+                    'type': event_type,
+                    'fleet_hash': self.fleets[output_fleet]['hash'],
+                    'key': key,
+                    'star_system': star_system,
+                    'count': count
+                }
+                for i, (output_fleet, key, star_system, count) in enumerate(outputs)
+            ]
+        }
+        event['hash'] = util.hash_event(event)
+        event['signature'] = util.rsa_sign(self.fleets[fleet]['private'], event['hash'])
+        return event
+
+    def create_transfer(self, tip, used):
+        key = tip.pick_output(self.generator, used)
+        if key is None:
+            return None
+        fleet, system, count = tip.outputs[key]
+        recipient = self.generator.randrange(len(self.fleets))
+        if count == 1:
+            return fleet, 'transfer', [key], [(recipient, self.create_key(), system, count)]
+        sent = self.generator.randint(1, count - 1)
+        return fleet, 'transfer', [key], [(recipient, self.create_key(), system, sent), (fleet, self.create_key(), system, count - sent)]
+
+    def create_jump(self, tip, used):
+        key = tip.pick_output(self.generator, used)
+        if key is None:
+            return None
+        fleet, system, count = tip.outputs[key]
+        # Jumping to systems other fleets are in sets up attacks.
+        occupied = tip.pick_output(self.generator, used)
+        if occupied is not None and self.generator.random() < 0.5:
+            destination = tip.outputs[occupied][1]
+        else:
+            # The closest of a few systems, since far jumps lose most of their ships.
+            candidates = [tip.systems[self.generator.randrange(len(tip.systems))] for _ in range(0, 4)]
+            destination = min(candidates, key=lambda candidate: util.get_distance(system, candidate))
+        if destination == system:
+            return None
+        cost = util.get_jump_cost(system, destination, count)
+        if count <= cost:
+            return None
+        return fleet, 'jump', [key], [(fleet, self.create_key(), destination, count - cost)]
+
+    def create_attack(self, tip, used):
+        key = tip.pick_output(self.generator, used)
+        if key is None:
+            return None
+        fleet, system, count = tip.outputs[key]
+        tip.by_system[system] = [other for other in tip.by_system[system] if other in tip.outputs]
+        enemies = [other for other in tip.by_system[system] if other not in used and tip.outputs[other][0] != fleet]
+        if not enemies:
+            return None
+        enemy_key = enemies[self.generator.randrange(len(enemies))]
+        enemy, _, enemy_count = tip.outputs[enemy_key]
+        outputs = []
+        if enemy_count < count:
+            outputs = [(fleet, self.create_key(), system, count - enemy_count)]
+        elif count < enemy_count:
+            outputs = [(enemy, self.create_key(), system, enemy_count - count)]
+        return fleet, 'attack', [key, enemy_key], outputs
+
+    def create_star_log(self, tip):
+        """Creates and mines the next star log on a branch, moving the tip to it.
+
+        Args:
+            tip (Tip): Head of the branch, without a star log for a new chain.
+
+        Returns:
+            dict: Json of the star log.
+        """
+        height = tip.height + 1
+        if tip.star_log is None:
+            time = START_TIME
+            difficulty = util.difficultyStart()
+        else:
+            time = tip.star_log['time'] + self.spacing
+            difficulty = tip.star_log['difficulty']
+            if util.is_difficulty_changing(height):
+                difficulty = util.calculate_difficulty(difficulty, tip.star_log['time'] - tip.interval_start_time)
+        interval_start_time = time if tip.star_log is None or util.is_difficulty_changing(height) else tip.interval_start_time
+
+        events = []
+        used = set()
+        created = []
+        if 0 < self.events:
+            fleet = self.generator.randrange(len(self.fleets))
+            reward = (fleet, self.create_key(), None, util.shipReward())
+            events.append(self.create_event(fleet, 'reward', [], [reward], 0))
+            created.append(reward)
+        for _ in range(1, self.events):
+            create = self.generator.choice([self.create_transfer, self.create_jump, self.create_attack]) if tip.systems else self.create_transfer
+            result = create(tip, used)
+            if result is None:
+                continue
+            fleet, event_type, inputs, outputs = result
+            events.append(self.create_event(fleet, event_type, inputs, outputs, len(events)))
+            used.update(inputs)
+            created += outputs
+
+        star_log = {
+            'version': 0,
+            'previous_hash': util.EMPTY_TARGET if tip.star_log is None else tip.star_log['hash'],
+            'difficulty': difficulty,
+            'nonce': 0,
+            'time': time,
+            'events': events,
+            'meta': '',
+            'meta_hash': util.sha256('')
+        }
+        miner.mine(star_log)
+
+        tip.star_log = star_log
+        tip.height = height
+        tip.interval_start_time = interval_start_time
+        tip.systems.append(star_log['hash'])
+        for key in used:
+            del tip.outputs[key]
+        for fleet, key, star_system, count in created:
+            # Rewards are sent to the system of the star log they're in.
+            tip.add_output(key, fleet, star_log['hash'] if star_system is None else star_system, count)
+        return star_log
+
+    def generate(self, count):
+        """Generates a chain, along with any forks off of it, leaving `tip` at the head of the main chain.
+
+        Args:
+            count (int): Number of star logs on the main chain.
+
+        Yields:
+            dict: Json of each star log, parents before children.
+        """
+        self.tip = Tip()
+        for _ in range(0, count):
+            if self.tip.star_log is not None and self.generator.random() < self.fork_rate:
+                fork = self.tip.copy()
+                for _ in range(0, self.generator.randint(1, self.fork_length)):
+                    yield self.create_star_log(fork)
+            yield self.create_star_log(self.tip)
+
+
+def load(session, lines):
+    """Adds generated star logs straight to the database, without validating them.
+
+    Args:
+        session (Session): Session to add the star logs with, committed after each one.
+        lines (iterable): Json of each star log, one per line.
+
+    Returns:
+        int: Number of star logs added.
+    """
+    import ingest
+    count = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        ingest.star_log(session, json.loads(line), len(line))
+        session.commit()
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates synthetic star logs for load testing.')
+    commands = parser.add_subparsers(dest='command')
+    generate = commands.add_parser('generate', help='prints generated star logs as ndjson')
+    generate.add_argument('--star-logs', type=int, default=100)
+    generate.add_argument('--events', type=int, default=4)
+    generate.add_argument('--fleets', type=int, default=8)
+    generate.add_argument('--fork-rate', type=float, default=0.0)
+    generate.add_argument('--fork-length', type=int, default=1)
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--keys', default='keys.json')
+    commands.add_parser('load', help='adds star logs read from stdin to the database at DB_HOST')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        keys = load_key_pool(args.keys, args.fleets)
+        chain_generator = ChainGenerator(keys, args.seed, args.events, args.fork_rate, args.fork_length)
+        for star_log in chain_generator.generate(args.star_logs):
+            print(json.dumps(star_log, sort_keys=True))
+        return 0
+
+    import factory
+    import migrate
+    from models import database
+    app = factory.create_app({
+        'SQLALCHEMY_DATABASE_URI': os.getenv('DB_HOST', 'sqlite:///service.db')
+    })
+    # Star logs are loaded through ingest, which keeps the derived tables up to date, so an empty database is marked as migrated first.
+    migrate.require_migrated(app)
+    with app.app_context():
+        session = database.session()
+        try:
+            print('loaded %s star logs' % load(session, sys.stdin))
+        finally:
+            session.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,541 @@
+import json
+import re
+
+import util
+import validate
+import signatures
+import verify
+import ledger
+import metrics
+from models import StarLog, Fleet, Chain, ChainIndex, Event, EventSignature, \
+    EventInput, EventOutput, StarLogEventSignature, DifficultyInterval
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def star_log(session, star_log_json, size):
+    """Adds a star log that has passed validate.star_log to the session.
+
+    Args:
+        session (Session): Session to query with and add the star log to, left uncommitted.
+        star_log_json (dict): Star log to add.
+        size (int): Size in bytes of the star log as it was received.
+    """
+    previous_chain = None
+    previous_star_log = None
+    interval = None
+    previous_hash = star_log_json['previous_hash']
+    is_genesis = util.is_genesis_star_log(previous_hash)
+    if not is_genesis:
+        # The previous star log and the start of its difficulty interval come along with its chain index.
+        previous = session.query(ChainIndex, StarLog, DifficultyInterval)\
+            .join(StarLog, StarLog.id == ChainIndex.star_log_id)\
+            .outerjoin(DifficultyInterval, DifficultyInterval.star_log_id == StarLog.interval_id)\
+            .filter(ChainIndex.hash == previous_hash)\
+            .first()
+        if previous is None:
+            raise ValueError('previous starlog with hash %s cannot be found' % previous_hash)
+        previous_chain, previous_star_log, interval = previous
+
+    chain_index = session.query(ChainIndex).filter_by(hash=star_log_json['hash']).first()
+    if chain_index:
+        raise ValueError('starlog with hash %s already exists' % chain_index.hash)
+
+    highest_chain = session.query(Chain).order_by(Chain.chain.desc()).first()
+    root_id = None
+    previous_chain_id = None
+    previous_star_log_id = None
+    height = 0
+    chain_count = 0
+
+    if is_genesis:
+        chain_count = 0 if highest_chain is None else highest_chain.chain + 1
+    else:
+        root_id = previous_chain.id if previous_chain.root_id is None else previous_chain.root_id
+        previous_chain_id = previous_chain.id
+        previous_star_log_id = previous_chain.star_log_id
+        height = previous_chain.height + 1
+        chain_count = previous_chain.chain
+
+    interval_id = None
+    # If the previous StarLog has no interval_id, that means we recalculated difficulty on it.
+    if previous_star_log is not None:
+        interval_id = previous_star_log.interval_id if previous_star_log.interval_id == 0 or previous_star_log.interval_id is not None else previous_star_log.id
+
+    if is_genesis:
+        if star_log_json['difficulty'] != util.difficultyStart():
+            raise ValueError('difficulty for genesis starlog does not match starting difficulty')
+    elif util.is_difficulty_changing(height):
+        if interval is None:
+            # Databases that haven't been migrated yet have no difficulty intervals.
+            interval = session.query(StarLog).filter_by(id=previous_star_log.interval_id).first()
+        if interval is None:
+            raise ValueError('unable to find interval start with id %s' % (previous_star_log.interval_id))
+        duration = previous_star_log.time - interval.time
+        difficulty = util.calculate_difficulty(previous_star_log.difficulty, duration)
+        if star_log_json['difficulty'] != difficulty:
+            raise ValueError('difficulty does not match recalculated difficulty')
+        # This lets the next in the chain know to use our id for the interval_id.
+        interval_id = None
+    elif star_log_json['difficulty'] != previous_star_log.difficulty:
+        raise ValueError('difficulty does not match previous difficulty')
+
+    chain = None
+
+    if session.query(ChainIndex).filter_by(height=height, chain=chain_count).first():
+        # A sibling chain is being created.
+        root_id = None if is_genesis else previous_chain.id
+        chain_count = highest_chain.chain + 1
+        chain = Chain(height, None, chain_count, None)
+        session.add(chain)
+        ledger.add_chain(session, chain_count, previous_chain)
+    elif is_genesis:
+        chain = Chain(height, None, chain_count, None)
+        session.add(chain)
+    else:
+        chain = session.query(Chain).filter_by(chain=chain_count).first()
+        if chain is None:
+            raise ValueError('no chain %s exists' % chain_count)
+        chain.height = height
+
+    chain_index = ChainIndex(root_id, previous_chain_id, None, previous_star_log_id, star_log_json['hash'], star_log_json['previous_hash'], height, chain_count)
+    session.add(chain_index)
+    session.flush()
+    # The star log is added before its events, so every row referencing it can be inserted with its id.
+    star_log = StarLog(
+        star_log_json['hash'],
+        chain_index.id, height,
+        size,
+        star_log_json['log_header'],
+        star_log_json['version'],
+        star_log_json['previous_hash'],
+        star_log_json['difficulty'],
+        star_log_json['nonce'],
+        star_log_json['time'],
+        star_log_json['events_hash'],
+        interval_id,
+        star_log_json['meta'],
+        star_log_json['meta_hash']
+    )
+    session.add(star_log)
+    session.flush()
+    chain_index.star_log_id = star_log.id
+    chain.head_index_id = chain_index.id
+    chain.star_log_id = star_log.id
+    if interval_id is None:
+        session.add(DifficultyInterval(star_log.id, star_log.hash, chain_count, height, star_log.time, star_log.difficulty))
+
+    events_json = star_log_json['events']
+    output_fleets = [(current_output['fleet_hash'], None) for current_event in events_json for current_output in current_event['outputs']]
+    fleets = add_fleets(session, util.get_fleets(events_json) + output_fleets)
+
+    event_hashes = [current_event['hash'] for current_event in events_json]
+    input_keys = [current_input['key'] for current_event in events_json for current_input in current_event['inputs']]
+    output_keys = [current_output['key'] for current_event in events_json for current_output in current_event['outputs']]
+    star_system_hashes = [current_output['star_system'] for current_event in events_json for current_output in current_event['outputs'] if current_output['star_system']]
+    existing_signatures = dict([(match.hash, match) for match in query_in(session, EventSignature, EventSignature.hash, event_hashes)])
+    input_events = dict([(match.key, match) for match in query_in(session, Event, Event.key, input_keys)])
+    output_events = dict([(match.key, match) for match in query_in(session, Event, Event.key, output_keys)])
+    star_system_ids = dict([(match.hash, match.id) for match in query_in(session, StarLog, StarLog.hash, star_system_hashes)])
+
+    time = util.get_time()
+    new_signatures = []
+    new_events = []
+    new_inputs = []
+    new_outputs = []
+    spent_keys = []
+    created_keys = []
+    for current_event in events_json:
+        event_signature = existing_signatures.get(current_event['hash'])
+        fleet = fleets[current_event['fleet_hash']]
+        new_signature = event_signature is None
+        if new_signature:
+            new_signatures.append({
+                'type_id': util.get_event_type_id(current_event['type']),
+                'fleet_id': fleet.id,
+                'hash': current_event['hash'],
+                'signature': current_event['signature'],
+                'time': time,
+                'confirmations': 1
+            })
+        else:
+            event_signature.confirmations += 1
+
+        inputs = []
+        for current_input in current_event['inputs']:
+            # Check if we even have an input with the matching key.
+            target_input = input_events.get(current_input['key'])
+            if target_input is None:
+                raise Exception('event %s is not accounted for' % current_input['key'])
+            # Append this for further validation.
+            inputs.append(target_input)
+            spent_keys.append(current_input['key'])
+            if new_signature:
+                new_inputs.append((target_input.id, current_event['hash'], current_input['index']))
+
+        outputs = []
+        for current_output in current_event['outputs']:
+            if new_signature:
+                if current_output['key'] in output_events:
+                    raise Exception('output key %s already exists' % current_output['key'])
+                target_star_system_id = None
+                if current_output['star_system']:
+                    target_star_system_id = star_system_ids.get(current_output['star_system'])
+                    if target_star_system_id is None:
+                        raise Exception('star system %s is not accounted for' % current_output['star_system'])
+                target_output = Event(current_output['key'], util.get_event_type_id(current_output['type']), fleets[current_output['fleet_hash']].id, current_output['count'], target_star_system_id)
+                new_events.append(target_output)
+                new_outputs.append((current_output['key'], current_event['hash'], current_output['index']))
+            else:
+                target_output = output_events.get(current_output['key'])
+            created_keys.append(current_output['key'])
+            # Append this for further validation.
+            outputs.append(target_output)
+
+        if current_event['type'] == 'jump':
+            verify.jump(session, fleet, inputs, outputs)
+        elif current_event['type'] == 'attack':
+            verify.attack(fleet, inputs, outputs)
+        elif current_event['type'] == 'transfer':
+            verify.transfer(fleet, inputs, outputs)
+        elif current_event['type'] not in ['reward']:
+            raise Exception('event type %s not supported' % current_event['type'])
+
+    # Make sure the inputs were created earlier on this branch, and haven't been used on it since.
+    ledger.spend_all(session, ledger.get_branch(session, previous_chain), chain_index, spent_keys)
+
+    if new_signatures:
+        session.execute(EventSignature.__table__.insert(), new_signatures)
+    signature_ids = dict(query_in(session, EventSignature, EventSignature.hash, event_hashes, EventSignature.id))
+    if events_json:
+        session.execute(StarLogEventSignature.__table__.insert(), [{
+            'event_signature_id': signature_ids[current_event['hash']],
+            'star_log_id': star_log.id,
+            'index': current_event['index']
+        } for current_event in events_json])
+    if new_events:
+        session.execute(Event.__table__.insert(), [{
+            'key': current_output.key,
+            'type_id': current_output.type_id,
+            'fleet_id': current_output.fleet_id,
+            'count': current_output.count,
+            # Outputs without a star system are in the one this star log probed.
+            'star_system_id': star_log.id if current_output.star_system_id is None else current_output.star_system_id
+        } for current_output in new_events])
+        event_ids = dict(query_in(session, Event, Event.key, [current_output.key for current_output in new_events], Event.id))
+        session.execute(EventOutput.__table__.insert(), [{
+            'event_id': event_ids[key],
+            'event_signature_id': signature_ids[sha],
+            'index': index
+        } for key, sha, index in new_outputs])
+    if new_inputs:
+        session.execute(EventInput.__table__.insert(), [{
+            'event_id': event_id,
+            'event_signature_id': signature_ids[sha],
+            'index': index
+        } for event_id, sha, index in new_inputs])
+    ledger.create_all(session, chain_index, created_keys)
+
+
+def add_fleets(session, fleets):
+    """Adds any fleets that don't exist yet with a single insert.
+
+    Args:
+        session (Session): Session to query with and add the fleets with.
+        fleets (list): Tuples of fleet hashes and their keys, the first key listed for a hash is used.
+
+    Returns:
+        dict: Every fleet listed, by hash.
+    """
+    hashes = [fleet_hash for fleet_hash, _ in fleets]
+    existing = dict([(match.hash, match) for match in query_in(session, Fleet, Fleet.hash, hashes)])
+    missing = []
+    for fleet_hash, fleet_public_key in fleets:
+        if fleet_hash not in existing and fleet_hash not in [current['hash'] for current in missing]:
+            missing.append({'hash': fleet_hash, 'public_key': fleet_public_key})
+    if missing:
+        session.execute(Fleet.__table__.insert(), missing)
+        for match in query_in(session, Fleet, Fleet.hash, [current['hash'] for current in missing]):
+            existing[match.hash] = match
+    return existing
+
+
+def query_in(session, model, column, values, *columns):
+    """Queries the rows of a model with a column in the provided values.
+
+    Args:
+        session (Session): Session to query with.
+        model (Model): Model to query.
+        column (Column): Column to filter by.
+        values (list): Values to match, with nothing queried if empty.
+        columns (Column): Columns to query instead of the whole model, following the filtered column.
+
+    Returns:
+        list: The matching rows.
+    """
+    if not values:
+        return []
+    query = session.query(column, *columns) if columns else session.query(model)
+    return query.filter(column.in_(list(set(values)))).all()
+
+
+def event(session, event_json):
+    """Validates an event that has yet to be included in a star log and adds it to the session.
+
+    Args:
+        session (Session): Session to query with and add the event to, left uncommitted.
+        event_json (dict): Event to add.
+    """
+    with metrics.stage('event_fields'):
+        validate.event(event_json, False, True, False)
+    with metrics.stage('event_lookup'):
+        if session.query(EventSignature).filter_by(hash=event_json['hash']).first():
+            raise Exception('event with hash %s already exists' % event_json['hash'])
+
+        fleet = session.query(Fleet).filter_by(hash=event_json['fleet_hash']).first()
+    with metrics.stage('event_ledger'):
+        event_signature = EventSignature(util.get_event_type_id(event_json['type']), fleet.id, event_json['hash'], event_json['signature'], util.get_time(), 0)
+        session.add(event_signature)
+        session.flush()
+        inputs = []
+        for current_input in event_json['inputs']:
+            target_input = session.query(Event).filter_by(key=current_input['key']).first()
+            if target_input is None:
+                raise Exception('event with key %s not accounted for' % current_input['key'])
+            inputs.append(target_input)
+            session.add(EventInput(target_input.id, event_signature.id, current_input['index']))
+        outputs = []
+        for current_output in event_json['outputs']:
+            target_output = session.query(Event).filter_by(key=current_output['key']).first()
+            if target_output is None:
+                output_fleet = session.query(Fleet).filter_by(hash=current_output['fleet_hash']).first()
+                if output_fleet is None:
+                    output_fleet = Fleet(current_output['fleet_hash'], None)
+                    session.add(output_fleet)
+                    session.flush()
+                target_star_system = session.query(StarLog).filter_by(hash=current_output['star_system']).first()
+                if target_star_system is None:
+                    raise Exception('star system %s is not accounted for' % current_output['star_system'])
+
+                target_output = Event(current_output['key'],
+                                      util.get_event_type_id(current_output['type']),
+                                      output_fleet.id,
+                                      current_output['count'],
+                                      target_star_system.id)
+                session.add(target_output)
+                session.flush()
+            outputs.append(target_output)
+            event_output = EventOutput(target_output.id,
+                                       event_signature.id,
+                                       current_output['index'])
+            session.add(event_output)
+    with metrics.stage('event_rules'):
+        if event_json['type'] == 'jump':
+            verify.jump(session, fleet, inputs, outputs)
+        elif event_json['type'] == 'attack':
+            verify.attack(fleet, inputs, outputs)
+        elif event_json['type'] == 'transfer':
+            verify.transfer(fleet, inputs, outputs)
+        else:
+            raise Exception('event type %s not supported' % event_json['type'])
+
+
+def receive_event(session, data):
+    """Validates and adds an event as it was received.
+
+    Args:
+        session (Session): Session to query with and add the event to, left uncommitted.
+        data (str): Event as it was received.
+    """
+    with metrics.outcome('event'):
+        with metrics.stage('event_size'):
+            validate.byte_size(util.maximumEventSize(), data)
+        with metrics.stage('event_parse'):
+            event_json = json.loads(data)
+        event(session, event_json)
+
+
+def lookup(session, star_log_json, pending_hashes=()):
+    """Rejects a star log that already exists or whose parent is unknown, before its events are checked.
+
+    Args:
+        session (Session): Session to query with.
+        star_log_json (dict): Star log with a valid header.
+        pending_hashes (collection): Hashes of star logs about to be added ahead of this one.
+    """
+    sha = star_log_json['hash']
+    previous_hash = star_log_json['previous_hash']
+    existing = [match for match, in session.query(ChainIndex.hash).filter(ChainIndex.hash.in_([sha, previous_hash]))]
+    if sha in existing or sha in pending_hashes:
+        raise ValueError('starlog with hash %s already exists' % sha)
+    if not util.is_genesis_star_log(previous_hash) and previous_hash not in existing and previous_hash not in pending_hashes:
+        raise ValueError('previous starlog with hash %s cannot be found' % previous_hash)
+
+
+def prepare(session, data, pending_signatures, pending_hashes=()):
+    """Runs the stages of ingestion that come before signatures on a star log as it was received.
+
+    Stages are ordered cheapest first, so most invalid star logs are
+    rejected before their events are hashed.
+
+    Args:
+        session (Session): Session to query with.
+        data (str): Star log as it was received.
+        pending_signatures (list): Signatures of the events are appended to this.
+        pending_hashes (collection): Hashes of star logs about to be added ahead of this one.
+
+    Returns:
+        dict: The parsed star log.
+    """
+    with metrics.stage('size'):
+        validate.byte_size(util.maximumStarLogSize(), data)
+    with metrics.stage('parse'):
+        star_log_json = json.loads(data)
+    with metrics.stage('header'):
+        validate.star_log_header(star_log_json)
+    with metrics.stage('difficulty'):
+        validate.difficulty(star_log_json['difficulty'], star_log_json['hash'])
+    with metrics.stage('lookup'):
+        lookup(session, star_log_json, pending_hashes)
+    with metrics.stage('events'):
+        validate.star_log_events(star_log_json, pending_signatures)
+    return star_log_json
+
+
+def receive_star_log(session, data):
+    """Validates and adds a star log as it was received.
+
+    Args:
+        session (Session): Session to query with and add the star log to, left uncommitted.
+        data (str): Star log as it was received.
+    """
+    pending_signatures = []
+    with metrics.outcome('star_log'):
+        star_log_json = prepare(session, data, pending_signatures)
+        with metrics.stage('signatures'):
+            signatures.load_verified(session, star_log_json['events'])
+            signatures.verify(pending_signatures)
+        with metrics.stage('ledger'):
+            star_log(session, star_log_json, len(data))
+
+
+def split_array(data):
+    """Splits a json array into the text of each of its items, exactly as they were received.
+
+    Items are sized and parsed from the bytes the client sent, the same as
+    star logs posted one at a time, rather than from a copy re-serialized
+    with a different key order and whitespace.
+
+    Args:
+        data (str): Json array as it was received.
+
+    Returns:
+        list: Text of each item, in order.
+    """
+    decoder = json.JSONDecoder()
+    index = _whitespace.match(data, 0).end()
+    if data[index:index + 1] != '[':
+        raise ValueError('batch must be a json array')
+    index = _whitespace.match(data, index + 1).end()
+    items = []
+    if data[index:index + 1] == ']':
+        index += 1
+    else:
+        while True:
+            _, end = decoder.raw_decode(data, index)
+            items.append(data[index:end])
+            index = _whitespace.match(data, end).end()
+            if data[index:index + 1] == ',':
+                index = _whitespace.match(data, index + 1).end()
+            elif data[index:index + 1] == ']':
+                index += 1
+                break
+            else:
+                raise ValueError('expected , or ] at character %s of batch' % index)
+    if _whitespace.match(data, index).end() != len(data):
+        raise ValueError('unexpected data after batch')
+    return items
+
+
+def star_logs(session, bodies, chunk_size):
+    """Validates and adds an ordered list of star logs, committing them in chunks.
+
+    Each star log is validated against the ones before it in the list, so a
+    chain can be added in one request. A rejected star log does not stop the
+    rest of the list, though any star logs depending on it will be rejected as
+    well.
+
+    Args:
+        session (Session): Session to query with and commit the star logs to.
+        bodies (list): Star logs as they were received, in the order to add them.
+        chunk_size (int): Number of star logs to add before each commit.
+
+    Returns:
+        list: The result of each star log, in the order provided.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk size must be greater than zero')
+    results = []
+    for chunk_start in range(0, len(bodies), chunk_size):
+        chunk_bodies = bodies[chunk_start:chunk_start + chunk_size]
+        chunk_results = []
+        chunk_json = []
+        chunk_signatures = []
+        pending_hashes = set()
+        for index, data in enumerate(chunk_bodies, chunk_start):
+            result = {
+                'index': index,
+                'hash': None,
+                'status': 200,
+                'error': None
+            }
+            chunk_results.append(result)
+            pending_signatures = []
+            try:
+                star_log_json = prepare(session, data, pending_signatures, pending_hashes)
+                result['hash'] = star_log_json['hash']
+                pending_hashes.add(star_log_json['hash'])
+                chunk_json.append(star_log_json)
+                chunk_signatures.append(pending_signatures)
+            except Exception as error:
+                result['status'] = 400
+                result['error'] = str(error)
+                metrics.ingested('star_log', metrics.get_reason(error))
+                chunk_json.append(None)
+                chunk_signatures.append([])
+
+        # The signatures of the whole chunk are verified together so they can be spread across the pool.
+        chunk_events = [current for star_log_json in chunk_json if star_log_json is not None for current in star_log_json['events']]
+        with metrics.timer() as elapsed:
+            signatures.load_verified(session, chunk_events)
+            errors = signatures.verify_groups(chunk_signatures)
+        checked = len([result for result in chunk_results if result['status'] == 200])
+        for result, error in zip(chunk_results, errors):
+            if result['status'] != 200:
+                continue
+            metrics.record('signatures', error is None, elapsed[0] / checked)
+            if error is not None:
+                result['status'] = 400
+                result['error'] = error
+                metrics.ingested('star_log', 'signatures')
+
+        for result, star_log_json, data in zip(chunk_results, chunk_json, chunk_bodies):
+            if result['status'] != 200:
+                continue
+            # Each star log gets a savepoint, so a rejected one is rolled back without the ones before it.
+            savepoint = session.begin_nested()
+            try:
+                with metrics.stage('ledger'):
+                    star_log(session, star_log_json, len(data))
+                savepoint.commit()
+            except Exception as error:
+                savepoint.rollback()
+                result['status'] = 400
+                result['error'] = str(error)
+                metrics.ingested('star_log', metrics.get_reason(error))
+        session.commit()
+        for result in chunk_results:
+            if result['status'] == 200:
+                metrics.ingested('star_log')
+        results += chunk_results
+    return results
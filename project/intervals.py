@@ -0,0 +1,42 @@
+import ledger
+import util
+from models import StarLog, ChainIndex, DifficultyInterval
+
+
+def schedule(session, head_hash=None):
+    """Gets the difficulty intervals of a branch, along with the difficulty expected of the next star log on it.
+
+    Args:
+        session (Session): Session to query with.
+        head_hash (str): Hash of the star log at the head of the branch, the highest star log if None.
+
+    Returns:
+        dict: Json of the schedule, or None if the head cannot be found.
+    """
+    query = session.query(ChainIndex, StarLog).join(StarLog, StarLog.id == ChainIndex.star_log_id)
+    if head_hash is None:
+        query = query.order_by(ChainIndex.height.desc(), ChainIndex.id)
+    else:
+        query = query.filter(ChainIndex.hash == head_hash)
+    head = query.first()
+    if head is None:
+        return None
+    head_chain_index, head_star_log = head
+
+    branch = ledger.get_branch(session, head_chain_index)
+    intervals = [interval for interval in session.query(DifficultyInterval)
+                 .filter(DifficultyInterval.chain.in_(branch.keys()))
+                 .order_by(DifficultyInterval.height)
+                 if ledger.is_on_branch(branch, interval.chain, interval.height)]
+
+    next_height = head_chain_index.height + 1
+    next_difficulty = head_star_log.difficulty
+    if util.is_difficulty_changing(next_height) and intervals:
+        next_difficulty = util.calculate_difficulty(head_star_log.difficulty, head_star_log.time - intervals[-1].time)
+    return {
+        'hash': head_chain_index.hash,
+        'height': head_chain_index.height,
+        'intervals': [interval.get_json() for interval in intervals],
+        'next_height': next_height,
+        'next_difficulty': next_difficulty
+    }
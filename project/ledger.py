@@ -0,0 +1,138 @@
+from models import ChainAncestor, EventLedger
+
+
+def add_chain(session, chain, previous_chain_index):
+    """Records the ancestors of a new chain.
+
+    Args:
+        session (Session): Session to query with and add the ancestors to.
+        chain (int): The new chain.
+        previous_chain_index (ChainIndex): Entry the new chain forks off of, or None for a new genesis.
+    """
+    if previous_chain_index is None:
+        return
+    session.add(ChainAncestor(chain, previous_chain_index.chain, previous_chain_index.height))
+    for ancestor in session.query(ChainAncestor).filter_by(chain=previous_chain_index.chain).all():
+        session.add(ChainAncestor(chain, ancestor.ancestor_chain, ancestor.height))
+
+
+def get_branch(session, chain_index):
+    """Gets the chains making up the branch that ends with the provided chain index.
+
+    Args:
+        session (Session): Session to query with.
+        chain_index (ChainIndex): Last entry of the branch, or None for an empty branch.
+
+    Returns:
+        dict: The height each chain on the branch is included up to, keyed by chain.
+    """
+    if chain_index is None:
+        return {}
+    branch = dict([(ancestor.ancestor_chain, ancestor.height) for ancestor in session.query(ChainAncestor).filter_by(chain=chain_index.chain)])
+    branch[chain_index.chain] = chain_index.height
+    return branch
+
+
+def is_ancestor(session, ancestor_chain_index, chain_index):
+    """Checks if an entry is included in the branch ending with another entry.
+
+    Args:
+        session (Session): Session to query with.
+        ancestor_chain_index (ChainIndex): Possible ancestor.
+        chain_index (ChainIndex): Last entry of the branch.
+
+    Returns:
+        bool: True if the possible ancestor is the entry itself or one of its ancestors.
+    """
+    if ancestor_chain_index.chain == chain_index.chain:
+        return ancestor_chain_index.height <= chain_index.height
+    ancestor = session.query(ChainAncestor)\
+        .filter_by(chain=chain_index.chain, ancestor_chain=ancestor_chain_index.chain)\
+        .first()
+    return ancestor is not None and ancestor_chain_index.height <= ancestor.height
+
+
+def is_on_branch(branch, chain, height):
+    """Checks if an entry of a chain is included in a branch.
+
+    Args:
+        branch (dict): Branch from `get_branch`.
+        chain (int): Chain of the entry.
+        height (int): Height of the entry.
+
+    Returns:
+        bool: True if the entry is included in the branch.
+    """
+    return chain in branch and height <= branch[chain]
+
+
+def create(session, chain_index, key):
+    """Records the creation of an event by the star log of the provided chain index.
+
+    Args:
+        session (Session): Session to add the entry to.
+        chain_index (ChainIndex): Entry of the star log creating the event.
+        key (str): Key of the created event.
+    """
+    create_all(session, chain_index, [key])
+
+
+def create_all(session, chain_index, keys):
+    """Records the creation of events by the star log of the provided chain index in a single insert.
+
+    Args:
+        session (Session): Session to add the entries with.
+        chain_index (ChainIndex): Entry of the star log creating the events.
+        keys (list): Keys of the created events.
+    """
+    if keys:
+        session.execute(EventLedger.__table__.insert(), [_ledger_row(chain_index, key, False) for key in keys])
+
+
+def spend(session, branch, chain_index, key):
+    """Verifies an event was created on a branch and not used on it since, then records its use.
+
+    Args:
+        session (Session): Session to query with and add the entry to.
+        branch (dict): Branch from `get_branch` that the star log is being added to.
+        chain_index (ChainIndex): Entry of the star log using the event.
+        key (str): Key of the event being used.
+    """
+    spend_all(session, branch, chain_index, [key])
+
+
+def spend_all(session, branch, chain_index, keys):
+    """Verifies events were created on a branch and not used on it since, then records their use.
+
+    Args:
+        session (Session): Session to query with and add the entries with.
+        branch (dict): Branch from `get_branch` that the star log is being added to.
+        chain_index (ChainIndex): Entry of the star log using the events.
+        keys (list): Keys of the events being used.
+    """
+    if not keys:
+        return
+    entries = {}
+    for entry in session.query(EventLedger).filter(EventLedger.key.in_(keys)):
+        entries.setdefault(entry.key, []).append(entry)
+    for key in keys:
+        created = False
+        for entry in entries.get(key, []):
+            if not is_on_branch(branch, entry.chain, entry.height):
+                continue
+            if entry.spent:
+                raise Exception('event %s has already been used at height %s' % (key, entry.height))
+            created = True
+        if not created:
+            raise Exception('event input %s does not have a valid output event' % key)
+    session.execute(EventLedger.__table__.insert(), [_ledger_row(chain_index, key, True) for key in keys])
+
+
+def _ledger_row(chain_index, key, spent):
+    return {
+        'key': key,
+        'chain_index_id': chain_index.id,
+        'chain': chain_index.chain,
+        'height': chain_index.height,
+        'spent': spent
+    }
@@ -0,0 +1,507 @@
+import atexit
+import contextlib
+import errno
+import fcntl
+import json
+import os
+import threading
+import time
+
+# Upper bounds, in seconds, of the buckets request latencies are counted in.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type and help text of every metric exposed, in the order they're listed.
+METRICS = [
+    ('cryptoverse_requests_total', 'counter', 'Requests handled, by route, method and status.'),
+    ('cryptoverse_request_seconds', 'histogram', 'Time spent handling requests, by route and method.'),
+    ('cryptoverse_request_queries_total', 'counter', 'Sql statements run while handling requests, by route and method.'),
+    ('cryptoverse_ingested_total', 'counter', 'Star logs and events accepted, or rejected by the stage that rejected them.'),
+    ('cryptoverse_stage_total', 'counter', 'Runs of each validation stage, by whether they passed.'),
+    ('cryptoverse_stage_seconds_total', 'counter', 'Time spent in each validation stage.'),
+    ('cryptoverse_cache_hits_total', 'counter', 'Cache lookups that found a value.'),
+    ('cryptoverse_cache_misses_total', 'counter', 'Cache lookups that found nothing.'),
+    ('cryptoverse_cache_evictions_total', 'counter', 'Values evicted from caches to make room.'),
+    ('cryptoverse_cache_hit_ratio', 'gauge', 'Hits over lookups of each cache, across every process.'),
+    ('cryptoverse_cache_entries', 'gauge', 'Values held by each cache, by process.'),
+    ('cryptoverse_cache_size', 'gauge', 'Size of the values held by each cache, by process.'),
+    ('cryptoverse_db_pool_size', 'gauge', 'Connections the database pool keeps open, by process.'),
+    ('cryptoverse_db_pool_checked_out', 'gauge', 'Database connections in use, by process.'),
+    ('cryptoverse_db_pool_overflow', 'gauge', 'Database connections open beyond the pool size, by process.'),
+    ('cryptoverse_chain_height', 'gauge', 'Height of the highest chain.'),
+    ('cryptoverse_forks', 'gauge', 'Chains forked off the first one.')
+]
+
+# Least seconds between writes of a process's metrics, so requests don't each wait on the disk.
+FLUSH_SECONDS = 1.0
+# Counters of processes that have exited are added up in this file, in the directory shared by every process.
+EXITED_FILE = 'exited.json'
+
+_stages = {}
+_counters = {}
+_histograms = {}
+_caches = {}
+_gauges = {}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+_flush_timer = None
+_exit_directories = set()
+
+
+@contextlib.contextmanager
+def timer():
+    """Times the enclosed block.
+
+    Returns:
+        list: Holds the elapsed seconds once the block exits.
+    """
+    elapsed = [0.0]
+    start = time.time()
+    try:
+        yield elapsed
+    finally:
+        elapsed[0] = time.time() - start
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Times a stage of processing, counting whether it passed or raised.
+
+    Args:
+        name (str): Name of the stage.
+    """
+    start = time.time()
+    passed = False
+    try:
+        yield
+        passed = True
+    except Exception as error:
+        # The innermost stage is the one that rejected, so outer stages leave it alone.
+        if getattr(error, 'stage', None) is None:
+            error.stage = name
+        raise
+    finally:
+        record(name, passed, time.time() - start)
+
+
+def record(name, passed, seconds):
+    """Counts a run of a stage that was timed separately.
+
+    Args:
+        name (str): Name of the stage.
+        passed (bool): Whether the stage passed.
+        seconds (float): Time spent in the stage.
+    """
+    with _lock:
+        current = _stages.setdefault(name, {'passed': 0, 'rejected': 0, 'seconds': 0.0})
+        current['passed' if passed else 'rejected'] += 1
+        current['seconds'] += seconds
+
+
+def get_stages():
+    """Gets the counters of every stage timed so far.
+
+    Returns:
+        dict: Times each stage passed and rejected, and the total seconds spent in it, by stage name.
+    """
+    with _lock:
+        return dict([(name, dict(current)) for name, current in _stages.items()])
+
+
+def reset():
+    """Clears the counters of every stage, along with every other counter and histogram."""
+    global _last_flush, _flush_timer
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _histograms.clear()
+    with _flush_lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        _last_flush = 0.0
+
+
+def get_labels(labels):
+    """Gets labels in the form metrics are keyed by.
+
+    Args:
+        labels (dict): Label values by name.
+
+    Returns:
+        tuple: Sorted (name, value) pairs of the labels.
+    """
+    return tuple(sorted([(name, str(value)) for name, value in labels.items()]))
+
+
+def increment(name, labels, amount=1):
+    """Adds to a counter.
+
+    Args:
+        name (str): Name of the metric.
+        labels (dict): Label values by name.
+        amount (float): Amount to add.
+    """
+    key = (name, get_labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, labels, value):
+    """Counts a value in a histogram with the `LATENCY_BUCKETS`.
+
+    Args:
+        name (str): Name of the metric.
+        labels (dict): Label values by name.
+        value (float): Value observed.
+    """
+    key = (name, get_labels(labels))
+    with _lock:
+        current = _histograms.get(key)
+        if current is None:
+            current = _histograms[key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                current['buckets'][index] += 1
+        current['sum'] += value
+        current['count'] += 1
+
+
+def get_reason(error):
+    """Gets why a star log or event was rejected.
+
+    Args:
+        error (Exception): Error it was rejected with.
+
+    Returns:
+        str: Name of the stage that raised the error, or other if it was raised outside any stage.
+    """
+    return getattr(error, 'stage', None) or 'other'
+
+
+def ingested(kind, reason=None):
+    """Counts a star log or event that was accepted or rejected.
+
+    Args:
+        kind (str): Either star_log or event.
+        reason (str): Stage that rejected it, or None if it was accepted.
+    """
+    if reason is None:
+        increment('cryptoverse_ingested_total', {'kind': kind, 'result': 'accepted', 'reason': ''})
+    else:
+        increment('cryptoverse_ingested_total', {'kind': kind, 'result': 'rejected', 'reason': reason})
+
+
+@contextlib.contextmanager
+def outcome(kind):
+    """Counts a star log or event as accepted if the enclosed block passes, or rejected if it raises.
+
+    Args:
+        kind (str): Either star_log or event.
+    """
+    try:
+        yield
+    except Exception as error:
+        ingested(kind, get_reason(error))
+        raise
+    ingested(kind)
+
+
+def register_cache(name, cache):
+    """Exposes the counters of a cache.
+
+    Args:
+        name (str): Name to label the cache's metrics with.
+        cache (LruCache): Cache to expose.
+    """
+    with _lock:
+        _caches[name] = cache
+
+
+def register_gauges(name, function):
+    """Exposes gauges of this process that are read when the metrics are collected.
+
+    Args:
+        name (str): Name of the gauges, registering another function with it replaces the first.
+        function (function): Returns a list of (name, labels, value) of each gauge.
+    """
+    with _lock:
+        _gauges[name] = function
+
+
+def get_state():
+    """Gets every metric of this process.
+
+    Returns:
+        dict: Json of the process id, and the counters, histograms and gauges of this process.
+    """
+    with _lock:
+        counters = [[name, labels, value] for (name, labels), value in _counters.items()]
+        histograms = [[name, labels, current['buckets'], current['sum'], current['count']] for (name, labels), current in _histograms.items()]
+        for name, current in _stages.items():
+            counters.append(['cryptoverse_stage_total', get_labels({'stage': name, 'result': 'passed'}), current['passed']])
+            counters.append(['cryptoverse_stage_total', get_labels({'stage': name, 'result': 'rejected'}), current['rejected']])
+            counters.append(['cryptoverse_stage_seconds_total', get_labels({'stage': name}), current['seconds']])
+        caches = list(_caches.items())
+        functions = list(_gauges.values())
+    gauges = []
+    for name, cache in caches:
+        stats = cache.get_stats()
+        labels = get_labels({'cache': name})
+        counters.append(['cryptoverse_cache_hits_total', labels, stats['hits']])
+        counters.append(['cryptoverse_cache_misses_total', labels, stats['misses']])
+        counters.append(['cryptoverse_cache_evictions_total', labels, stats['evictions']])
+        gauges.append(['cryptoverse_cache_entries', labels, stats['entries']])
+        gauges.append(['cryptoverse_cache_size', labels, stats['size']])
+    for function in functions:
+        gauges += [[name, get_labels(labels), value] for name, labels, value in function()]
+    return {
+        'pid': os.getpid(),
+        'counters': counters,
+        'histograms': histograms,
+        'gauges': gauges
+    }
+
+
+def write_state(path, state):
+    """Writes metrics to a file.
+
+    Args:
+        path (str): File to write.
+        state (dict): Metrics from `get_state`.
+    """
+    # Written to a temporary file first, so other processes never read it half written.
+    with open(path + '.tmp', 'w') as state_file:
+        json.dump(state, state_file)
+    os.rename(path + '.tmp', path)
+
+
+def read_state(path):
+    """Reads metrics written by `write_state`.
+
+    Args:
+        path (str): File to read.
+
+    Returns:
+        dict: The metrics, or None if the file is missing or unreadable.
+    """
+    try:
+        with open(path) as state_file:
+            return json.load(state_file)
+    except (IOError, ValueError):
+        return None
+
+
+def flush(directory, force=False):
+    """Writes the metrics of this process to a directory shared by every process of the service.
+
+    Metrics are written at most once every `FLUSH_SECONDS`. Ones flushed
+    sooner are written when the interval passes, and again as the process
+    exits.
+
+    Args:
+        directory (str): Directory to write to, nothing is written if it's empty.
+        force (bool): Writes the metrics now, whenever they were last written.
+    """
+    global _last_flush, _flush_timer
+    if not directory:
+        return
+    with _flush_lock:
+        if directory not in _exit_directories:
+            _exit_directories.add(directory)
+            atexit.register(flush, directory, True)
+        wait = _last_flush + FLUSH_SECONDS - time.time()
+        if not force and 0 < wait:
+            if _flush_timer is None:
+                _flush_timer = threading.Timer(wait, flush, [directory, True])
+                _flush_timer.daemon = True
+                _flush_timer.start()
+            return
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        _last_flush = time.time()
+        write_state(os.path.join(directory, '%s.json' % os.getpid()), get_state())
+
+
+def is_running(pid):
+    """Checks whether a process is still running.
+
+    Args:
+        pid (int): Id of the process.
+
+    Returns:
+        bool: True if the process exists.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
+
+
+def get_file_pid(file_name):
+    """Gets the process a file of metrics belongs to.
+
+    Args:
+        file_name (str): Name of the file in the metrics directory.
+
+    Returns:
+        int: Id of the process, or None if it isn't a process's file.
+    """
+    if not file_name.endswith('.json') or not file_name[:-len('.json')].isdigit():
+        return None
+    return int(file_name[:-len('.json')])
+
+
+def fold_exited(directory):
+    """Adds the counters of processes that have exited to `EXITED_FILE`, removing their own files.
+
+    Totals don't go down when workers are recycled, and the directory doesn't
+    gain a file for every worker ever started. Callers must hold the lock on
+    the directory.
+
+    Args:
+        directory (str): Directory each process flushes its metrics to.
+
+    Returns:
+        int: Number of files folded.
+    """
+    exited_path = os.path.join(directory, EXITED_FILE)
+    count = 0
+    for file_name in os.listdir(directory):
+        pid = get_file_pid(file_name)
+        if pid is None or pid == os.getpid() or is_running(pid):
+            continue
+        path = os.path.join(directory, file_name)
+        states = [state for state in [read_state(exited_path), read_state(path)] if state is not None]
+        counters, histograms, _ = merge(states)
+        write_state(exited_path, {
+            'pid': None,
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, current['buckets'], current['sum'], current['count']] for (name, labels), current in histograms.items()],
+            'gauges': []
+        })
+        os.remove(path)
+        count += 1
+    return count
+
+
+def collect(directory):
+    """Gets the metrics of every process of the service.
+
+    Args:
+        directory (str): Directory each process flushes its metrics to, or empty to only get this process's.
+
+    Returns:
+        list: States from `get_state` of each process, and of the processes that have exited.
+    """
+    if not directory:
+        return [get_state()]
+    flush(directory, True)
+    # Held while reading too, so a file being folded is never counted twice.
+    with open(os.path.join(directory, 'collect.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        fold_exited(directory)
+        states = []
+        for file_name in sorted(os.listdir(directory)):
+            if get_file_pid(file_name) is None and file_name != EXITED_FILE:
+                continue
+            state = read_state(os.path.join(directory, file_name))
+            # A process may have been replacing its file, it's picked up on the next scrape.
+            if state is not None:
+                states.append(state)
+    return states
+
+
+def merge(states):
+    """Sums the metrics of every process.
+
+    Counters and histograms of processes that have exited are kept, so
+    totals never go down when a worker restarts. Gauges are only kept for
+    running processes, labeled with the process they came from.
+
+    Args:
+        states (list): States from `get_state` of each process.
+
+    Returns:
+        tuple: Counters by (name, labels), histograms by (name, labels), and gauges by (name, labels).
+    """
+    counters = {}
+    histograms = {}
+    gauges = {}
+    for state in states:
+        for name, labels, value in state['counters']:
+            key = (name, tuple([tuple(label) for label in labels]))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in state['histograms']:
+            key = (name, tuple([tuple(label) for label in labels]))
+            current = histograms.setdefault(key, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+            current['buckets'] = [left + right for left, right in zip(current['buckets'], buckets)]
+            current['sum'] += total
+            current['count'] += count
+        if state['pid'] is None or (state['pid'] != os.getpid() and not is_running(state['pid'])):
+            continue
+        for name, labels, value in state['gauges']:
+            key = (name, tuple(sorted([tuple(label) for label in labels] + [('pid', str(state['pid']))])))
+            gauges[key] = value
+    for (name, labels), hits in counters.items():
+        if name == 'cryptoverse_cache_hits_total':
+            lookups = hits + counters.get(('cryptoverse_cache_misses_total', labels), 0)
+            gauges[('cryptoverse_cache_hit_ratio', labels)] = 0.0 if lookups == 0 else float(hits) / lookups
+    return counters, histograms, gauges
+
+
+def format_labels(labels):
+    """Formats labels for the Prometheus text format.
+
+    Args:
+        labels (tuple): Sorted (name, value) pairs.
+
+    Returns:
+        str: The labels in braces, or nothing if there are none.
+    """
+    if not labels:
+        return ''
+    escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels]
+    return '{%s}' % ','.join(['%s="%s"' % label for label in escaped])
+
+
+def format_value(value):
+    """Formats a sample value for the Prometheus text format."""
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render(states, gauges=()):
+    """Renders metrics in the Prometheus text format.
+
+    Args:
+        states (list): States from `get_state` of each process.
+        gauges (list): (name, labels, value) of gauges that are the same for every process.
+
+    Returns:
+        str: Text to serve to Prometheus.
+    """
+    counters, histograms, process_gauges = merge(states)
+    for name, labels, value in gauges:
+        process_gauges[(name, get_labels(labels))] = value
+    lines = []
+    for name, kind, description in METRICS:
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, kind))
+        if kind == 'histogram':
+            for key in sorted([key for key in histograms if key[0] == name]):
+                current = histograms[key]
+                labels = key[1]
+                for bound, count in zip(LATENCY_BUCKETS, current['buckets']):
+                    lines.append('%s_bucket%s %s' % (name, format_labels(labels + (('le', repr(bound)),)), count))
+                lines.append('%s_bucket%s %s' % (name, format_labels(labels + (('le', '+Inf'),)), current['count']))
+                lines.append('%s_sum%s %s' % (name, format_labels(labels), format_value(current['sum'])))
+                lines.append('%s_count%s %s' % (name, format_labels(labels), current['count']))
+            continue
+        samples = counters if kind == 'counter' else process_gauges
+        for key in sorted([key for key in samples if key[0] == name]):
+            lines.append('%s%s %s' % (name, format_labels(key[1]), format_value(samples[key])))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,234 @@
+import os
+import sys
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+
+import factory
+import util
+from models import database, Chain, ChainAncestor, ChainIndex, Event, \
+    EventInput, EventOutput, EventLedger, StarLogEventSignature, StarLog, \
+    DifficultyInterval, Migration
+
+
+def add_missing_indices(engine):
+    """Creates every index declared on the models that is missing from an existing database.
+
+    Args:
+        engine (Engine): Engine connected to the database to migrate.
+
+    Returns:
+        list: Names of the indices that were created.
+    """
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+    created = []
+    for table in sorted(database.metadata.tables.values(), key=lambda x: x.name):
+        if table.name not in existing_tables:
+            # Missing tables are created along with their indices by create_all.
+            continue
+        existing_indices = [index['name'] for index in inspector.get_indexes(table.name)]
+        for index in sorted(table.indexes, key=lambda x: x.name):
+            if index.name in existing_indices:
+                continue
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
+
+
+def rebuild_event_ledger(session):
+    """Records the creation and use of every event in every star log in the event ledger.
+
+    Args:
+        session (Session): Session to query with and add the entries to.
+
+    Returns:
+        int: Number of entries added to the ledger.
+    """
+    session.query(EventLedger).delete()
+    count = 0
+    for model, spent in [(EventOutput, False), (EventInput, True)]:
+        for chain_index, key in session\
+                .query(ChainIndex, Event.key)\
+                .join(StarLogEventSignature, StarLogEventSignature.star_log_id == ChainIndex.star_log_id)\
+                .join(model, model.event_signature_id == StarLogEventSignature.event_signature_id)\
+                .join(Event, Event.id == model.event_id):
+            session.add(EventLedger(key, chain_index.id, chain_index.chain, chain_index.height, spent))
+            count += 1
+    return count
+
+
+def rebuild_chain_ancestors(session):
+    """Records the ancestors of every chain.
+
+    Args:
+        session (Session): Session to query with and add the ancestors to.
+
+    Returns:
+        int: Number of ancestors added.
+    """
+    session.query(ChainAncestor).delete()
+    ancestors = {}
+    # Chains are numbered in the order they're created, so parents are always handled first.
+    for chain in session.query(Chain).order_by(Chain.chain):
+        ancestors[chain.chain] = []
+        first = session.query(ChainIndex).filter_by(chain=chain.chain).order_by(ChainIndex.height).first()
+        if first is None or first.previous_id is None:
+            continue
+        previous_chain_index = session.query(ChainIndex).filter_by(id=first.previous_id).first()
+        ancestors[chain.chain] = [(previous_chain_index.chain, previous_chain_index.height)] + ancestors[previous_chain_index.chain]
+    count = 0
+    for chain, chain_ancestors in ancestors.items():
+        for ancestor_chain, height in chain_ancestors:
+            session.add(ChainAncestor(chain, ancestor_chain, height))
+            count += 1
+    return count
+
+
+def rebuild_difficulty_intervals(session):
+    """Records the star logs that start each difficulty interval.
+
+    Args:
+        session (Session): Session to query with and add the intervals to.
+
+    Returns:
+        int: Number of intervals added.
+    """
+    session.query(DifficultyInterval).delete()
+    count = 0
+    # Star logs without an interval_id are the ones difficulty was recalculated on.
+    for star_log, chain in session\
+            .query(StarLog, ChainIndex.chain)\
+            .join(ChainIndex, ChainIndex.id == StarLog.chain_index_id)\
+            .filter(StarLog.interval_id.is_(None))\
+            .order_by(StarLog.id):
+        session.add(DifficultyInterval(star_log.id, star_log.hash, chain, star_log.height, star_log.time, star_log.difficulty))
+        count += 1
+    return count
+
+
+# Tables derived from the star logs, in the order they're rebuilt. A migration
+# row is added once each is rebuilt, since an empty or partially filled table
+# doesn't show whether it was kept up to date from the first star log.
+REBUILDS = [
+    ('chain_ancestors', rebuild_chain_ancestors),
+    ('event_ledger', rebuild_event_ledger),
+    ('difficulty_intervals', rebuild_difficulty_intervals)
+]
+
+
+def get_missing_rebuilds(session):
+    """Gets the tables that have yet to be rebuilt on this database.
+
+    Args:
+        session (Session): Session to query with.
+
+    Returns:
+        list: Names of the rebuilds without a migration row.
+    """
+    done = set([name for name, in session.query(Migration.name)])
+    return [name for name, _ in REBUILDS if name not in done]
+
+
+def rebuild_missing(session):
+    """Rebuilds every table that has yet to be rebuilt, recording a migration for each.
+
+    Args:
+        session (Session): Session to query with and add the entries to, left uncommitted.
+
+    Returns:
+        list: Descriptions of the changes made.
+    """
+    missing = get_missing_rebuilds(session)
+    changes = []
+    for name, rebuild in REBUILDS:
+        if name not in missing:
+            continue
+        changes.append('rebuilt %s with %s entries' % (name.replace('_', ' '), rebuild(session)))
+        session.add(Migration(name, util.get_time()))
+    return changes
+
+
+def check_migrated(session):
+    """Makes sure every table derived from the star logs is up to date before anything is ingested.
+
+    A database without any star logs has nothing to rebuild, so it's marked
+    as migrated.
+
+    Args:
+        session (Session): Session to query with and mark the database with.
+
+    Raises:
+        Exception: If star logs exist and the database needs migrating.
+    """
+    missing = get_missing_rebuilds(session)
+    if not missing:
+        return
+    if session.query(StarLog.id).first() is not None:
+        raise Exception('database needs migrating, run project/migrate.py to rebuild %s' % ', '.join(missing))
+    for name in missing:
+        session.add(Migration(name, util.get_time()))
+    try:
+        session.commit()
+    except IntegrityError:
+        # Another process marked the empty database first.
+        session.rollback()
+
+
+def require_migrated(app):
+    """Creates any missing tables, then refuses to start an app or worker whose database needs migrating.
+
+    Star logs accepted before the derived tables are rebuilt would be
+    checked against incomplete tables.
+
+    Args:
+        app (Flask): App with the database to check configured.
+    """
+    with app.app_context():
+        database.create_all()
+        session = database.session()
+        try:
+            check_migrated(session)
+        finally:
+            session.close()
+
+
+def migrate(app):
+    """Brings the database of the provided app up to date with the models in place.
+
+    Args:
+        app (Flask): App with the database to migrate configured.
+
+    Returns:
+        list: Descriptions of the changes made.
+    """
+    with app.app_context():
+        engine = database.get_engine(app)
+        changes = ['created index %s' % name for name in add_missing_indices(engine)]
+        database.create_all()
+        session = database.session()
+        try:
+            changes += rebuild_missing(session)
+            session.commit()
+        finally:
+            session.close()
+        return changes
+
+
+def main():
+    app = factory.create_app({
+        'SQLALCHEMY_DATABASE_URI': os.getenv('DB_HOST', 'sqlite:///service.db')
+    })
+    try:
+        changes = migrate(app)
+    except Exception as error:
+        print('migration failed: %s' % error)
+        return 1
+    for change in changes:
+        print(change)
+    print('database is up to date')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Searches for nonces that give star logs a hash meeting their difficulty.
+
+Usage:
+    python project/miner.py [--processes N] [--chunk N] < star_log.json
+
+The star log is read from stdin, and printed to stdout with its nonce,
+events_hash, log_header and hash filled in. The hash rate is printed to
+stderr.
+"""
+import argparse
+import binascii
+import hashlib
+import json
+import multiprocessing
+import sys
+import time
+
+import util
+
+
+def get_target_digest(difficulty):
+    """Gets the target of a difficulty as a digest, so hashes can be compared to it without converting them.
+
+    Args:
+        difficulty (int): Packed int representation of a difficulty.
+
+    Returns:
+        str: Big endian bytes of the target, any digest less than it meets the difficulty.
+    """
+    return binascii.unhexlify('%064x' % util.unpack_target(difficulty))
+
+
+def search(header_prefix, target_digest, start, stop):
+    """Tries every nonce in a range, stopping at the first that meets the target.
+
+    The prefix is only hashed once, and a copy of the hasher is finished
+    with each nonce.
+
+    Args:
+        header_prefix (str): Header of the star log without its nonce.
+        target_digest (str): Target from `get_target_digest`.
+        start (int): First nonce to try.
+        stop (int): Nonce to stop before.
+
+    Returns:
+        tuple: The nonce found or None, and the number of nonces tried.
+    """
+    prefix = hashlib.sha256(header_prefix)
+    for nonce in xrange(start, stop):
+        hasher = prefix.copy()
+        hasher.update(str(nonce))
+        if hasher.digest() < target_digest:
+            return nonce, nonce - start + 1
+    return None, stop - start
+
+
+def _search(arguments):
+    """Searches a range of nonces, taking its arguments as a tuple so it can be mapped over a pool.
+
+    Args:
+        arguments (tuple): Arguments of `search`.
+
+    Returns:
+        tuple: Result of `search`.
+    """
+    return search(*arguments)
+
+
+def mine(star_log, processes=1, chunk=100000):
+    """Finds a nonce that gives the star log a hash meeting its difficulty.
+
+    Nonces are searched in chunks, spread across the processes, starting from
+    the star log's current nonce.
+
+    Args:
+        star_log (dict): Star log to mine, its events_hash, log_header, hash
+        and nonce are replaced.
+        processes (int): Number of processes to search with.
+        chunk (int): Number of nonces each process searches at a time.
+
+    Returns:
+        dict: The hashes tried, seconds elapsed, and hashes per second.
+    """
+    start_time = time.time()
+    util.hash_star_log(star_log)
+    target_digest = get_target_digest(star_log['difficulty'])
+    header_prefix = util.concat_star_log_header(star_log, False)
+    first = star_log['nonce']
+    ranges = ((header_prefix, target_digest, start, min(start + chunk, util.MAXIMUM_NONCE + 1)) for start in xrange(first, util.MAXIMUM_NONCE + 1, chunk))
+    found = None
+    hashes = 0
+    if processes < 2:
+        for current in ranges:
+            found, attempts = search(*current)
+            hashes += attempts
+            if found is not None:
+                break
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            # Results come back in order, so the lowest nonce that meets the target is the one used.
+            for found, attempts in pool.imap(_search, ranges):
+                hashes += attempts
+                if found is not None:
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+    if found is None:
+        raise Exception('no nonce from %s meets the difficulty' % first)
+    star_log['nonce'] = found
+    util.hash_star_log(star_log)
+    elapsed = time.time() - start_time
+    return {
+        'hashes': hashes,
+        'seconds': elapsed,
+        'hashes_per_second': hashes / elapsed if 0 < elapsed else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Finds a nonce for the star log read from stdin.')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk', type=int, default=100000)
+    args = parser.parse_args()
+    star_log = json.load(sys.stdin)
+    try:
+        stats = mine(star_log, args.processes, args.chunk)
+    except Exception as error:
+        sys.stderr.write('mining failed: %s\n' % error)
+        return 1
+    sys.stderr.write('%s hashes in %.2f s, %.0f hashes/s\n' % (stats['hashes'], stats['seconds'], stats['hashes_per_second']))
+    print(json.dumps(star_log))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,11 @@
+import contextlib
+import re
+import threading
+import time
+
 from flask_sqlalchemy import SQLAlchemy, SignallingSession, SessionBase
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Index, \
+    event
 
 import util
 
@@ -31,11 +37,142 @@ class _SignallingSession(SignallingSession):
                              **options)
 
 
+class QueryCounter(object):
+    """Counts the statements run on a thread, and the time spent running them.
+
+    Statements are also counted by their shape, with the parameters of IN
+    clauses collapsed, so the same query repeated for each row of a result
+    stands out.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        shape = get_statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def get_repeated(self, maximum, selects_only=False):
+        """Gets the statement shapes that ran more than a maximum number of times.
+
+        Args:
+            maximum (int): Most times a shape may run.
+            selects_only (bool): Only include SELECT statements, since writes repeat once per row added.
+
+        Returns:
+            list: Each shape and the number of times it ran, most first.
+        """
+        repeated = [(shape, count) for shape, count in self.shapes.items() if maximum < count]
+        if selects_only:
+            repeated = [(shape, count) for shape, count in repeated if shape.upper().startswith('SELECT')]
+        return sorted(repeated, key=lambda x: (-x[1], x[0]))
+
+
+_in_parameters = re.compile(r'\?(\s*,\s*\?)+')
+_counting = threading.local()
+
+
+def get_statement_shape(statement):
+    """Gets a statement with any list of parameters collapsed into one.
+
+    Args:
+        statement (str): Sql statement as it was sent to the database.
+
+    Returns:
+        str: The statement with its whitespace and parameter lists collapsed.
+    """
+    return _in_parameters.sub('?', ' '.join(statement.split()))
+
+
+def start_counting():
+    """Starts counting the statements run on this thread.
+
+    Returns:
+        QueryCounter: Counter receiving each statement until `stop_counting` is called with it.
+    """
+    counter = QueryCounter()
+    if not hasattr(_counting, 'counters'):
+        _counting.counters = []
+    _counting.counters.append(counter)
+    return counter
+
+
+def stop_counting(counter):
+    """Stops a counter from `start_counting` from receiving statements.
+
+    Args:
+        counter (QueryCounter): Counter to stop.
+    """
+    counters = getattr(_counting, 'counters', [])
+    if counter in counters:
+        counters.remove(counter)
+
+
+@contextlib.contextmanager
+def count_queries():
+    """Counts the statements run on this thread within the enclosed block.
+
+    Returns:
+        QueryCounter: Counter of the statements.
+    """
+    counter = start_counting()
+    try:
+        yield counter
+    finally:
+        stop_counting(counter)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_start_times', []).append(time.time())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.time() - connection.info['query_start_times'].pop()
+    for counter in getattr(_counting, 'counters', []):
+        counter.record(statement, elapsed)
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute, so their start time is dropped here.
+    start_times = context.connection.info.get('query_start_times') if context.connection is not None else None
+    if start_times:
+        start_times.pop()
+
+
+def _sqlite_connect(connection, record):
+    # Pysqlite commits before any SAVEPOINT it sees, so it's kept from managing transactions itself.
+    connection.isolation_level = None
+
+
+def _sqlite_begin(connection):
+    connection.execute('BEGIN')
+
+
 class _SQLAlchemy(SQLAlchemy):
-    """A subclass of `SQLAlchemy` that uses `_SignallingSession`."""
+    """A subclass of `SQLAlchemy` that uses `_SignallingSession`, and reports
+    every statement run on its engines to the active `QueryCounter`s.
+
+    Sqlite engines begin their own transactions, so savepoints work on them.
+    """
     def create_session(self, options):
         return _SignallingSession(self, **options)
 
+    def get_engine(self, app, bind=None):
+        engine = SQLAlchemy.get_engine(self, app, bind)
+        with self._engine_lock:
+            if not event.contains(engine, 'after_cursor_execute', _after_cursor_execute):
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+                event.listen(engine, 'handle_error', _handle_error)
+                if engine.dialect.name == 'sqlite':
+                    event.listen(engine, 'connect', _sqlite_connect)
+                    event.listen(engine, 'begin', _sqlite_begin)
+        return engine
+
 
 database = _SQLAlchemy()
 
@@ -44,16 +181,19 @@ database = _SQLAlchemy()
 
 class StarLog(database.Model):
     __tablename__ = 'star_logs'
+    __table_args__ = (
+        Index('ix_star_logs_time_id', 'time', 'id'),
+    )
     extend_existing = True
 
     id = Column(Integer, primary_key=True)
-    hash = Column(String(64))
+    hash = Column(String(64), index=True, unique=True)
     chain_index_id = Column(Integer, ForeignKey('chain_indices.id'))
-    height = Column(Integer)
+    height = Column(Integer, index=True)
     size = Column(Integer)
     log_header = Column(String(255))
     version = Column(Integer)
-    previous_hash = Column(String(64))
+    previous_hash = Column(String(64), index=True)
     difficulty = Column(Integer)
     nonce = Column(Integer)
     time = Column(Integer)
@@ -115,14 +255,17 @@ class StarLog(database.Model):
 
 class ChainIndex(database.Model):
     __tablename__ = 'chain_indices'
+    __table_args__ = (
+        Index('ix_chain_indices_height_chain', 'height', 'chain', unique=True),
+    )
     extend_existing = True
 
     id = Column(Integer, primary_key=True)
     root_id = Column(Integer, ForeignKey('chain_indices.id'))
     previous_id = Column(Integer, ForeignKey('chain_indices.id'))
-    star_log_id = Column(Integer, ForeignKey('star_logs.id'))
+    star_log_id = Column(Integer, ForeignKey('star_logs.id'), index=True, unique=True)
     previous_star_log_id = Column(Integer, ForeignKey('star_logs.id'))
-    hash = Column(String(64))
+    hash = Column(String(64), index=True, unique=True)
     previous_hash = Column(String(64))
     height = Column(Integer)
     chain = Column(Integer)
@@ -163,7 +306,7 @@ class Chain(database.Model):
     id = Column(Integer, primary_key=True)
     height = Column(Integer)
     head_index_id = Column(Integer)
-    chain = Column(Integer)
+    chain = Column(Integer, index=True, unique=True)
     star_log_id = Column(Integer)
 
     def __repr__(self):
@@ -182,12 +325,70 @@ class Chain(database.Model):
         }
 
 
+class ChainAncestor(database.Model):
+    __tablename__ = 'chain_ancestors'
+    extend_existing = True
+
+    id = Column(Integer, primary_key=True)
+    chain = Column(Integer, index=True)
+    ancestor_chain = Column(Integer)
+    height = Column(Integer)
+
+    def __repr__(self):
+        return '<Chain Ancestor %s>' % self.id
+
+    def __init__(self, chain, ancestor_chain, height):
+        self.chain = chain
+        self.ancestor_chain = ancestor_chain
+        self.height = height
+
+    def get_json(self):
+        return {
+            'chain': self.chain,
+            'ancestor_chain': self.ancestor_chain,
+            'height': self.height
+        }
+
+
+class DifficultyInterval(database.Model):
+    __tablename__ = 'difficulty_intervals'
+    extend_existing = True
+
+    id = Column(Integer, primary_key=True)
+    star_log_id = Column(Integer, ForeignKey('star_logs.id'), index=True, unique=True)
+    hash = Column(String(64))
+    chain = Column(Integer, index=True)
+    height = Column(Integer)
+    time = Column(Integer)
+    difficulty = Column(Integer)
+
+    def __repr__(self):
+        return '<Difficulty Interval %s>' % self.id
+
+    def __init__(self, star_log_id, hash, chain, height, time, difficulty):
+        self.star_log_id = star_log_id
+        self.hash = hash
+        self.chain = chain
+        self.height = height
+        self.time = time
+        self.difficulty = difficulty
+
+    def get_json(self):
+        return {
+            'hash': self.hash,
+            'chain': self.chain,
+            'height': self.height,
+            'time': self.time,
+            'difficulty': self.difficulty
+        }
+
+
 class Fleet(database.Model):
     __tablename__ = 'fleets'
     extend_existing = True
 
     id = Column(Integer, primary_key=True)
-    hash = Column(String(64))
+    hash = Column(String(64), index=True, unique=True)
     public_key = Column(String(392))
 
     def __repr__(self):
@@ -211,7 +412,7 @@ class Event(database.Model):
     id = Column(Integer, primary_key=True)
     type_id = Column(Integer)
     fleet_id = Column(Integer, ForeignKey('fleets.id'))
-    key = Column(String(64))
+    key = Column(String(64), index=True, unique=True)
     count = Column(Integer)
     star_system_id = Column(Integer, ForeignKey('star_logs.id'))
 
@@ -236,7 +437,7 @@ class EventSignature(database.Model):
     id = Column(Integer, primary_key=True)
     type_id = Column(Integer)
     fleet_id = Column(Integer, ForeignKey('fleets.id'))
-    hash = Column(String(64))
+    hash = Column(String(64), index=True, unique=True)
     signature = Column(String(512))
     time = Column(Integer)
     confirmations = Column(Integer)
@@ -276,8 +477,8 @@ class EventInput(database.Model):
     extend_existing = True
 
     id = Column(Integer, primary_key=True)
-    event_id = Column(Integer, ForeignKey('events.id'))
-    event_signature_id = Column(Integer, ForeignKey('event_signatures.id'))
+    event_id = Column(Integer, ForeignKey('events.id'), index=True)
+    event_signature_id = Column(Integer, ForeignKey('event_signatures.id'), index=True)
     index = Column(Integer)
 
     def __repr__(self):
@@ -300,8 +501,8 @@ class EventOutput(database.Model):
     extend_existing = True
 
     id = Column(Integer, primary_key=True)
-    event_id = Column(Integer, ForeignKey('events.id'))
-    event_signature_id = Column(Integer, ForeignKey('event_signatures.id'))
+    event_id = Column(Integer, ForeignKey('events.id'), index=True)
+    event_signature_id = Column(Integer, ForeignKey('event_signatures.id'), index=True)
     index = Column(Integer)
 
     def __repr__(self):
@@ -328,8 +529,8 @@ class StarLogEventSignature(database.Model):
     extend_existing = True
 
     id = Column(Integer, primary_key=True)
-    event_signature_id = Column(Integer, ForeignKey('event_signatures.id'))
-    star_log_id = Column(Integer, ForeignKey('star_logs.id'))
+    event_signature_id = Column(Integer, ForeignKey('event_signatures.id'), index=True)
+    star_log_id = Column(Integer, ForeignKey('star_logs.id'), index=True)
     index = Column(Integer)
 
     def __repr__(self):
@@ -344,6 +545,83 @@ class StarLogEventSignature(database.Model):
         return {}
 
 
+class EventLedger(database.Model):
+    __tablename__ = 'event_ledger'
+    extend_existing = True
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(64), index=True)
+    chain_index_id = Column(Integer, ForeignKey('chain_indices.id'))
+    chain = Column(Integer)
+    height = Column(Integer)
+    spent = Column(Boolean)
+
+    def __repr__(self):
+        return '<Event Ledger %s>' % self.id
+
+    def __init__(self, key, chain_index_id, chain, height, spent):
+        self.key = key
+        self.chain_index_id = chain_index_id
+        self.chain = chain
+        self.height = height
+        self.spent = spent
+
+    def get_json(self):
+        return {
+            'key': self.key,
+            'chain': self.chain,
+            'height': self.height,
+            'spent': self.spent
+        }
+
+
+class IngestTicket(database.Model):
+    __tablename__ = 'ingest_tickets'
+    extend_existing = True
+
+    id = Column(Integer, primary_key=True)
+    ticket = Column(String(32), index=True, unique=True)
+    kind = Column(String(16))
+    status = Column(String(16))
+    error = Column(String(255))
+    time = Column(Integer)
+
+    def __repr__(self):
+        return '<Ingest Ticket %s>' % self.ticket
+
+    def __init__(self, ticket, kind, status, error, time):
+        self.ticket = ticket
+        self.kind = kind
+        self.status = status
+        self.error = error
+        self.time = time
+
+    def get_json(self):
+        return {
+            'ticket': self.ticket,
+            'kind': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'time': self.time
+        }
+
+
+class Migration(database.Model):
+    __tablename__ = 'migrations'
+    extend_existing = True
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), index=True, unique=True)
+    time = Column(Integer)
+
+    def __repr__(self):
+        return '<Migration %s>' % self.name
+
+    def __init__(self, name, time):
+        self.name = name
+        self.time = time
+
+
 class EventType(database.Model):
     __tablename__ = 'event_types'
     extend_existing = True
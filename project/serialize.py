@@ -0,0 +1,103 @@
+import json
+
+from sqlalchemy.orm import aliased
+
+import util
+from cache import LruCache
+from models import StarLog, Fleet, Event, EventSignature, EventInput, \
+    EventOutput, StarLogEventSignature
+
+# Star logs never change once accepted, so their json is cached by hash.
+star_log_cache = util.register_rules_cache(LruCache(util.starLogsCacheMaxBytes(), len), 'star_logs_cache_max_bytes')
+
+
+def star_logs_json(session, matches):
+    """Serializes star logs to a json list, using cached json when possible.
+
+    Args:
+        session (Session): Session to query with when star logs are not cached.
+        matches (list): StarLog rows to serialize.
+
+    Returns:
+        str: Json list of the star logs, in the order provided.
+    """
+    serialized = {}
+    misses = []
+    for match in matches:
+        cached = star_log_cache.get(match.hash)
+        if cached is None:
+            misses.append(match)
+        else:
+            serialized[match.hash] = cached
+    for result in star_logs(session, misses):
+        serialized[result['hash']] = json.dumps(result)
+        star_log_cache.set(result['hash'], serialized[result['hash']])
+    return '[%s]' % ', '.join([serialized[match.hash] for match in matches])
+
+
+def star_logs(session, matches):
+    """Serializes star logs along with all of their events.
+
+    Every row needed for the page is loaded with a fixed number of set based
+    queries keyed by the star log ids, so the query count does not grow with
+    the number of events in each star log.
+
+    Args:
+        session (Session): Session to query with.
+        matches (list): StarLog rows to serialize.
+
+    Returns:
+        list: The json dicts of each star log, in the order provided.
+    """
+    if not matches:
+        return []
+    star_log_ids = [match.id for match in matches]
+    signature_ids = session\
+        .query(StarLogEventSignature.event_signature_id)\
+        .filter(StarLogEventSignature.star_log_id.in_(star_log_ids))
+
+    binds = {}
+    for bind in session.query(StarLogEventSignature)\
+            .filter(StarLogEventSignature.star_log_id.in_(star_log_ids))\
+            .order_by(StarLogEventSignature.id):
+        binds.setdefault(bind.star_log_id, []).append(bind)
+
+    signatures = {}
+    for signature, fleet in session.query(EventSignature, Fleet)\
+            .join(Fleet, Fleet.id == EventSignature.fleet_id)\
+            .filter(EventSignature.id.in_(signature_ids)):
+        signatures[signature.id] = (signature, fleet)
+
+    inputs = {}
+    for current_input, key in session.query(EventInput, Event.key)\
+            .join(Event, Event.id == EventInput.event_id)\
+            .filter(EventInput.event_signature_id.in_(signature_ids))\
+            .order_by(EventInput.id):
+        inputs.setdefault(current_input.event_signature_id, [])\
+            .append(current_input.get_json(key))
+
+    outputs = {}
+    star_system = aliased(StarLog)
+    for current_output, event, fleet_hash, star_system_hash in session\
+            .query(EventOutput, Event, Fleet.hash, star_system.hash)\
+            .join(Event, Event.id == EventOutput.event_id)\
+            .outerjoin(Fleet, Fleet.id == Event.fleet_id)\
+            .outerjoin(star_system, star_system.id == Event.star_system_id)\
+            .filter(EventOutput.event_signature_id.in_(signature_ids))\
+            .order_by(EventOutput.id):
+        outputs.setdefault(current_output.event_signature_id, [])\
+            .append((current_output, event, fleet_hash, star_system_hash))
+
+    results = []
+    for match in matches:
+        events = []
+        for bind in binds.get(match.id, []):
+            signature, fleet = signatures[bind.event_signature_id]
+            signature_outputs = []
+            for current_output, event, fleet_hash, star_system_hash in outputs.get(signature.id, []):
+                # Rewards sent to the probed system can't have been known, so they would be left blank.
+                output_star_system_hash = None if star_system_hash == match.hash else star_system_hash
+                signature_outputs.append(current_output.get_json(util.get_event_type_name(event.type_id), fleet_hash, event.key, output_star_system_hash, event.count))
+            events.append(signature.get_json(fleet.hash, fleet.public_key, inputs.get(signature.id, []), signature_outputs, bind.index))
+        results.append(match.get_json(events))
+    return results
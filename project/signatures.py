@@ -0,0 +1,120 @@
+import multiprocessing
+import threading
+
+import util
+import validate
+from cache import LruCache
+from models import Fleet, EventSignature
+
+_pool = None
+_pool_lock = threading.Lock()
+# Signatures that have already been verified, so events seen in the mempool aren't verified again in star logs.
+verified_cache = util.register_rules_cache(LruCache(util.verifiedEventsCacheMaxEntries()), 'verified_events_cache_max_entries')
+
+
+def get_pool():
+    """Gets the process pool used to verify signatures, creating it the first time it's needed.
+
+    Returns:
+        Pool: Pool with RSA_WORKERS processes, or None if signatures are verified serially.
+    """
+    global _pool
+    if util.rsaWorkers() < 2:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = multiprocessing.Pool(util.rsaWorkers())
+        return _pool
+
+
+def _verify(signature):
+    """Verifies a single signature, returning the error instead of raising it so it can cross processes.
+
+    Args:
+        signature (tuple): Stripped fleet key, hex signature, and the message that was signed.
+
+    Returns:
+        str: Reason the signature is invalid, or None if it is valid.
+    """
+    fleet_key, hex_signature, message = signature
+    try:
+        validate.rsa_parsed(validate.fleet_public_key(fleet_key), hex_signature, message)
+    except Exception as error:
+        return str(error)
+    return None
+
+
+def load_verified(session, events_json):
+    """Marks the signatures of events already stored with a matching fleet key and signature as verified.
+
+    Args:
+        session (Session): Session to query with.
+        events_json (list): Events that are about to be validated.
+    """
+    hashes = [current['hash'] for current in events_json if isinstance(current, dict) and isinstance(current.get('hash'), basestring)]
+    if not hashes:
+        return
+    for sha, signature, fleet_key in session\
+            .query(EventSignature.hash, EventSignature.signature, Fleet.public_key)\
+            .join(Fleet, Fleet.id == EventSignature.fleet_id)\
+            .filter(EventSignature.hash.in_(hashes)):
+        if fleet_key is not None:
+            verified_cache.set((fleet_key, signature, sha), True)
+
+
+def verify(signatures):
+    """Verifies signatures, stopping at the first invalid one.
+
+    Signatures verified before are skipped.
+
+    Args:
+        signatures (list): Tuples of the stripped fleet key, hex signature, and the message that was signed.
+    """
+    signatures = [signature for signature in signatures if verified_cache.get(signature) is None]
+    pool = get_pool()
+    if pool is None or len(signatures) < 2:
+        for signature in signatures:
+            error = _verify(signature)
+            if error is not None:
+                raise Exception(error)
+            verified_cache.set(signature, True)
+        return
+    chunk_size = max(1, len(signatures) // (util.rsaWorkers() * 4))
+    for error in pool.imap_unordered(_verify, signatures, chunk_size):
+        if error is not None:
+            # Remaining results are left to the pool, nothing is waiting on them.
+            raise Exception(error)
+    for signature in signatures:
+        verified_cache.set(signature, True)
+
+
+def verify_groups(groups):
+    """Verifies several lists of signatures at once, such as those of each star log in a batch.
+
+    Args:
+        groups (list): Lists of signatures, as passed to verify.
+
+    Returns:
+        list: Reason each group is invalid, or None if all of its signatures are valid.
+    """
+    flattened = [signature for group in groups for signature in group if verified_cache.get(signature) is None]
+    pool = get_pool()
+    if pool is None or len(flattened) < 2:
+        results = []
+        for group in groups:
+            try:
+                verify(group)
+                results.append(None)
+            except Exception as error:
+                results.append(str(error))
+        return results
+    chunk_size = max(1, len(flattened) // (util.rsaWorkers() * 4))
+    errors = dict(zip(flattened, pool.map(_verify, flattened, chunk_size)))
+    for signature, error in errors.items():
+        if error is None:
+            verified_cache.set(signature, True)
+    results = []
+    for group in groups:
+        group_errors = [errors[signature] for signature in group if errors.get(signature) is not None]
+        results.append(group_errors[0] if group_errors else None)
+    return results
@@ -0,0 +1,229 @@
+import math
+import threading
+import time
+
+from sqlalchemy import or_
+
+import util
+from models import database, StarLog
+
+# Most skipped ids kept to check again, the oldest are dropped past this so the query checking them stays small.
+MAXIMUM_GAPS = 100
+
+
+class GridIndex(object):
+    """A uniform grid over the cartesian positions of every known system.
+
+    Systems are added incrementally by refreshing from the star logs table,
+    only reading rows past the highest id already indexed. Ids are allocated
+    before rows are committed, so ones skipped over after the first refresh may
+    still show up, and are checked again on each refresh until
+    SPATIAL_GAP_SECONDS pass. Nearby searches
+    walk outward from the origin's cell one shell of cells at a time, and stop
+    as soon as no unvisited cell could hold a closer system.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Empties the index, sizing the grid for the current rules."""
+        self.digits = util.cartesianDigits()
+        self.cells_per_axis = max(1, util.spatialGridCells())
+        self.cell_size = max(1, -(-(16 ** self.digits) // self.cells_per_axis))
+        self.last_id = 0
+        self.loaded = False
+        self.gaps = {}
+        self.cells = {}
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, system_hash):
+        return system_hash in self.positions
+
+    def add(self, system_hash):
+        """Adds a system to the index.
+
+        Args:
+            system_hash (str): The system's Sha256 hash.
+        """
+        if system_hash in self.positions:
+            return
+        position = util.get_cartesian_tuple(system_hash)
+        self.positions[system_hash] = position
+        cell = tuple([axis // self.cell_size for axis in position])
+        self.cells.setdefault(cell, []).append((system_hash, position))
+
+    def refresh(self, session):
+        """Adds every star log accepted since the last refresh.
+
+        Args:
+            session (Session): Session to query with.
+
+        Returns:
+            int: Number of systems added.
+        """
+        with self._lock:
+            if self.digits != util.cartesianDigits() or self.cells_per_axis != max(1, util.spatialGridCells()):
+                self.reset()
+            now = time.time()
+            for gap_id, since in self.gaps.items():
+                if util.spatialGapSeconds() < now - since:
+                    del self.gaps[gap_id]
+            query = session.query(StarLog.id, StarLog.hash)
+            if self.gaps:
+                query = query.filter(or_(StarLog.id > self.last_id, StarLog.id.in_(list(self.gaps))))
+            else:
+                query = query.filter(StarLog.id > self.last_id)
+            count = 0
+            for star_log_id, system_hash in query.order_by(StarLog.id):
+                if star_log_id in self.gaps:
+                    del self.gaps[star_log_id]
+                elif self.last_id < star_log_id:
+                    # Holes in the table when it's first loaded are from long ago, not transactions still running.
+                    if self.loaded:
+                        for gap_id in xrange(max(self.last_id + 1, star_log_id - MAXIMUM_GAPS), star_log_id):
+                            self.gaps[gap_id] = now
+                    self.last_id = star_log_id
+                self.add(system_hash)
+                count += 1
+            if MAXIMUM_GAPS < len(self.gaps):
+                for gap_id in sorted(self.gaps)[:len(self.gaps) - MAXIMUM_GAPS]:
+                    del self.gaps[gap_id]
+            self.loaded = True
+            return count
+
+    def get_shell(self, center, radius):
+        """Gets the cells exactly `radius` cells away from the center, skipping ones outside the grid.
+
+        Args:
+            center (tuple): The (x, y, z) cell at the center.
+            radius (int): Chebyshev distance of the shell, in cells.
+
+        Returns:
+            list: The (x, y, z) cells of the shell.
+        """
+        cx, cy, cz = center
+        maximum = self.cells_per_axis - 1
+        z_range = range(max(0, cz - radius), min(maximum, cz + radius) + 1)
+        z_faces = [z for z in (cz - radius, cz + radius) if 0 <= z <= maximum]
+        cells = []
+        for x in range(max(0, cx - radius), min(maximum, cx + radius) + 1):
+            for y in range(max(0, cy - radius), min(maximum, cy + radius) + 1):
+                on_face = abs(x - cx) == radius or abs(y - cy) == radius
+                for z in (z_range if on_face else z_faces):
+                    cells.append((x, y, z))
+        return cells
+
+    def get_unvisited_distance(self, position, center, radius):
+        """Gets how close a system outside the visited shells could be.
+
+        Args:
+            position (tuple): The (x, y, z) position of the origin.
+            center (tuple): The (x, y, z) cell of the origin.
+            radius (int): Chebyshev distance of the outermost visited shell, in cells.
+
+        Returns:
+            float: Smallest possible distance to an unvisited system, or None if every cell was visited.
+        """
+        closest = None
+        for axis, cell in zip(position, center):
+            if 0 < cell - radius:
+                lower = axis - ((cell - radius) * self.cell_size)
+                closest = lower if closest is None else min(closest, lower)
+            if cell + radius < self.cells_per_axis - 1:
+                upper = ((cell + radius + 1) * self.cell_size) - axis
+                closest = upper if closest is None else min(closest, upper)
+        return closest
+
+    def nearby(self, system_hash, radius, limit):
+        """Gets the closest systems within a radius of a known system.
+
+        Args:
+            system_hash (str): The origin system's Sha256 hash.
+            radius (float): Largest distance to include.
+            limit (int): Largest number of systems to return.
+
+        Returns:
+            list: (distance, hash) of each system, closest first and then by hash.
+        """
+        with self._lock:
+            position = self.positions[system_hash]
+            x, y, z = position
+            center = tuple([axis // self.cell_size for axis in position])
+            exact = util.is_distance_exact()
+            found = []
+            shell = 0
+            while True:
+                for cell in self.get_shell(center, shell):
+                    for other_hash, other_position in self.cells.get(cell, ()):
+                        if other_hash == system_hash:
+                            continue
+                        # Same as util.get_cartesian_distance, without the overhead of the call.
+                        if exact:
+                            other_x, other_y, other_z = other_position
+                            distance = int(math.ceil(math.sqrt((x - other_x) ** 2 + (y - other_y) ** 2 + (z - other_z) ** 2)))
+                        else:
+                            distance = util.get_cartesian_distance(position, other_position)
+                        if distance <= radius:
+                            found.append((distance, other_hash))
+                unvisited = self.get_unvisited_distance(position, center, shell)
+                if unvisited is None or radius < unvisited:
+                    break
+                if limit <= len(found):
+                    found.sort()
+                    if found[limit - 1][0] < unvisited:
+                        break
+                shell += 1
+            found.sort()
+            return found[:limit]
+
+
+index = GridIndex()
+
+
+def load(app):
+    """Fills the index as a worker starts, so its first nearby search doesn't read every system.
+
+    Args:
+        app (Flask): App with the database to read configured.
+
+    Returns:
+        int: Number of systems added.
+    """
+    with app.app_context():
+        session = database.session()
+        try:
+            return index.refresh(session)
+        finally:
+            session.close()
+
+
+def nearby(session, system_hash, radius, limit):
+    """Gets the systems within a radius of a system, along with the cost of jumping to them.
+
+    Args:
+        session (Session): Session to refresh the index with.
+        system_hash (str): The origin system's Sha256 hash.
+        radius (float): Largest distance to include.
+        limit (int): Largest number of systems to return.
+
+    Returns:
+        list: Json of each system, closest first, or None if the origin is not a known system.
+    """
+    index.refresh(session)
+    if system_hash not in index:
+        return None
+    found = index.nearby(system_hash, radius, limit)
+    jump_costs = util.get_jump_costs(system_hash, [other_hash for _, other_hash in found])
+    return [
+        {
+            'hash': other_hash,
+            'distance': distance,
+            'jump_cost': float(jump_cost)
+        }
+        for (distance, other_hash), jump_cost in zip(found, jump_costs)
+    ]
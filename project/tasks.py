@@ -0,0 +1,119 @@
+"""Queue for ingesting star logs and events outside of the requests that posted them.
+
+Workers are started from the project directory with:
+    celery -A tasks worker
+"""
+import os
+import uuid
+
+from celery import Celery
+from flask import has_app_context
+
+import factory
+import ingest
+import metrics
+import migrate
+import util
+from models import database, IngestTicket
+
+celery = Celery('cryptoverse', broker=util.ingestBrokerUrl())
+# Nothing outside this process can consume an in memory broker, so its tasks are run as they're queued.
+celery.conf.task_always_eager = util.ingestBrokerUrl().startswith('memory://')
+if util.ingestBrokerUrl().startswith('filesystem://'):
+    # The filesystem transport passes messages through a shared directory, so no broker needs to be running.
+    for folder in ['out', 'processed']:
+        path = os.path.join(util.ingestQueueDirectory(), folder)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    celery.conf.broker_transport_options = {
+        'data_folder_in': os.path.join(util.ingestQueueDirectory(), 'out'),
+        'data_folder_out': os.path.join(util.ingestQueueDirectory(), 'out'),
+        'data_folder_processed': os.path.join(util.ingestQueueDirectory(), 'processed')
+    }
+
+_app = None
+
+
+def get_app():
+    """Gets the app the worker ingests with, creating it the first time it's needed.
+
+    Returns:
+        Flask: App connected to the database in DB_HOST.
+    """
+    global _app
+    if _app is None:
+        app = factory.create_app({
+            'SQLALCHEMY_DATABASE_URI': os.getenv('DB_HOST', 'sqlite:///service.db')
+        })
+        migrate.require_migrated(app)
+        _app = app
+    return _app
+
+
+def enqueue(session, kind, data):
+    """Records a ticket for a star log or event and queues it for ingestion.
+
+    Args:
+        session (Session): Session to add the ticket with, it is committed before queuing, and
+            again with the ticket marked failed if it can't be queued.
+        kind (str): Either star_log or event.
+        data (str): Body of the star log or event as it was received.
+
+    Returns:
+        dict: Json of the pending ticket.
+    """
+    ticket = IngestTicket(uuid.uuid4().hex, kind, 'pending', None, util.get_time())
+    session.add(ticket)
+    # Read before committing, as reloading it after would hold a transaction open on the session while an eager task runs.
+    result = ticket.get_json()
+    session.commit()
+    task = ingest_star_log if kind == 'star_log' else ingest_event
+    try:
+        task.delay(result['ticket'], data)
+    except Exception as exception:
+        # Otherwise the ticket would be left pending with nothing to ingest it.
+        session.query(IngestTicket).filter_by(ticket=result['ticket']).update({'status': 'failed', 'error': str(exception)[:255]})
+        session.commit()
+        raise
+    return result
+
+
+def run(ticket, target):
+    """Runs an ingestion and records its outcome on its ticket.
+
+    The ingestion gets a session of its own, since eager tasks are run
+    inside the request that queued them, whose session is still in use.
+
+    Args:
+        ticket (str): Ticket of the star log or event.
+        target (function): Takes a session and adds the star log or event to it.
+    """
+    if not has_app_context():
+        with get_app().app_context():
+            return run(ticket, target)
+    session = database.create_session({})
+    try:
+        status = 'accepted'
+        error = None
+        try:
+            target(session)
+            session.commit()
+        except Exception as exception:
+            session.rollback()
+            status = 'rejected'
+            error = str(exception)[:255]
+        session.query(IngestTicket).filter_by(ticket=ticket).update({'status': status, 'error': error})
+        session.commit()
+    finally:
+        session.close()
+        metrics.flush(util.metricsDirectory())
+
+
+@celery.task
+def ingest_star_log(ticket, data):
+    run(ticket, lambda session: ingest.receive_star_log(session, data))
+
+
+@celery.task
+def ingest_event(ticket, data):
+    run(ticket, lambda session: ingest.receive_event(session, data))
@@ -1,77 +1,272 @@
 import os
+import collections
+import json
 import hashlib
 import binascii
+import base64
 import time
 import math
 import uuid
 import numpy
+from cache import LruCache
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.serialization import load_pem_private_key
 
 
+def is_enabled(value):
+    return 0 < int(value)
+
+
+# Every setting read from the environment, as (name, variable, default, parser).
+SETTINGS = [
+    ('difficulty_fudge', 'DIFFICULTY_FUDGE', '0', int),
+    ('difficulty_interval', 'DIFFICULTY_INTERVAL', '10080', int),
+    ('difficulty_duration', 'DIFFICULTY_DURATION', '1209600', int),
+    ('difficulty_start', 'DIFFICULTY_START', '486604799', int),
+    ('ship_reward', 'SHIP_REWARD', '10', int),
+    ('star_logs_max_bytes', 'STARLOGS_MAX_BYTES', '999999', int),
+    ('events_max_bytes', 'EVENTS_MAX_BYTES', '999999', int),
+    ('cartesian_digits', 'CARTESIAN_DIGITS', '3', int),
+    ('jump_cost_min', 'JUMP_COST_MIN', '0.01', float),
+    ('jump_cost_max', 'JUMP_COST_MAX', '1.0', float),
+    ('jump_distance_max', 'JUMP_DIST_MAX', '2048.0', float),
+    ('star_logs_max_limit', 'STARLOGS_MAX_LIMIT', '10', int),
+    ('events_max_limit', 'EVENTS_MAX_LIMIT', '10', int),
+    ('chains_max_limit', 'CHAINS_MAX_LIMIT', '10', int),
+    ('star_logs_cache_max_bytes', 'STARLOGS_CACHE_MAX_BYTES', '16777216', int),
+    ('star_logs_batch_max_count', 'STARLOGS_BATCH_MAX_COUNT', '10000', int),
+    ('star_logs_batch_chunk', 'STARLOGS_BATCH_CHUNK', '100', int),
+    ('rsa_workers', 'RSA_WORKERS', '0', int),
+    ('public_keys_cache_max_entries', 'PUBLIC_KEYS_CACHE_MAX_ENTRIES', '4096', int),
+    ('verified_events_cache_max_entries', 'VERIFIED_EVENTS_CACHE_MAX_ENTRIES', '65536', int),
+    ('ingest_async', 'INGEST_ASYNC', '0', is_enabled),
+    ('ingest_broker_url', 'INGEST_BROKER_URL', 'memory://', str),
+    ('ingest_queue_directory', 'INGEST_QUEUE_DIR', 'ingest_queue', str),
+    ('cartesian_cache_max_entries', 'CARTESIAN_CACHE_MAX_ENTRIES', '65536', int),
+    ('spatial_grid_cells', 'SPATIAL_GRID_CELLS', '64', int),
+    ('spatial_gap_seconds', 'SPATIAL_GAP_SECONDS', '300', float),
+    ('nearby_max_limit', 'NEARBY_MAX_LIMIT', '100', int),
+    ('query_repeat_warning', 'QUERY_REPEAT_WARNING', '10', int),
+    ('metrics_directory', 'METRICS_DIR', '', str)
+]
+# Settings that decide which star logs and events are valid, shared with clients on /rules.
+PUBLIC_RULES = [
+    'difficulty_fudge',
+    'difficulty_duration',
+    'difficulty_interval',
+    'difficulty_start',
+    'ship_reward',
+    'cartesian_digits',
+    'jump_cost_min',
+    'jump_cost_max',
+    'jump_distance_max',
+    'star_logs_max_limit',
+    'events_max_limit',
+    'chains_max_limit',
+    'nearby_max_limit'
+]
+
+Rules = collections.namedtuple('Rules', [setting[0] for setting in SETTINGS] + ['fingerprint'])
+
+
+def load_rules():
+    """Reads every setting from the environment into an immutable snapshot, checking they're in range.
+
+    Returns:
+        Rules: The settings, along with a fingerprint of the public ones.
+    """
+    values = dict([(name, parser(os.getenv(variable, default))) for name, variable, default, parser in SETTINGS])
+    if not 3 <= values['cartesian_digits'] <= 21:
+        raise Exception('CARTESIAN_DIGITS must be a value from 3 to 21 (inclusive)')
+    if not 0 <= values['jump_cost_min'] < 1:
+        raise Exception('JUMP_COST_MIN must be a value from 0.0 to 1.0 (inclusive - exclusive)')
+    if not 0 < values['jump_cost_max'] <= 1:
+        raise Exception('JUMP_COST_MAX must be a value from 0.0 to 1.0 (exclusive - inclusive)')
+    if values['jump_cost_max'] <= values['jump_cost_min']:
+        raise Exception('JUMP_COST_MIN must be less than JUMP_COST_MAX')
+    if values['jump_distance_max'] <= 0:
+        raise Exception('JUMP_DIST_MAX must be greater than 0.0')
+    public = json.dumps(dict([(name, values[name]) for name in PUBLIC_RULES]), sort_keys=True)
+    values['fingerprint'] = hashlib.sha256(public).hexdigest()
+    return Rules(**values)
+
+
+# Caches of values computed under the rules, along with the setting each is sized by, or None if its size is fixed.
+rules_caches = []
+
+
+def register_rules_cache(cache, setting=None):
+    """Has a cache emptied, and resized, whenever the rules are reloaded.
+
+    Args:
+        cache (LruCache): Cache to register.
+        setting (str): Name of the rule holding the cache's maximum size, or None to keep its size.
+
+    Returns:
+        LruCache: The cache registered.
+    """
+    rules_caches.append((cache, setting))
+    return cache
+
+
+def reload_rules():
+    """Replaces the rules snapshot with one read from the environment again, emptying and resizing caches that depend on it.
+
+    The snapshot is only read once on import and again when an app is created,
+    so tests changing the environment need to call this afterwards. If the new
+    rules are out of range the old snapshot is kept.
+
+    Returns:
+        Rules: The new snapshot.
+    """
+    global rules
+    rules = load_rules()
+    for cache, setting in rules_caches:
+        cache.clear()
+        if setting is not None:
+            cache.maximum = getattr(rules, setting)
+    return rules
+
+
+def get_rules_json():
+    """Gets the public rules along with their fingerprint.
+
+    Returns:
+        dict: Json of the public rules.
+    """
+    result = dict([(name, getattr(rules, name)) for name in PUBLIC_RULES])
+    result['fingerprint'] = rules.fingerprint
+    return result
+
+
 def difficultyFudge():
-    return int(os.getenv('DIFFICULTY_FUDGE', '0'))
+    return rules.difficulty_fudge
 
 
 def difficultyInterval():
-    return int(os.getenv('DIFFICULTY_INTERVAL', '10080'))
+    return rules.difficulty_interval
 
 
 def difficultyDuration():
-    return int(os.getenv('DIFFICULTY_DURATION', '1209600'))
+    return rules.difficulty_duration
 
 
 def difficultyStart():
-    return int(os.getenv('DIFFICULTY_START', '486604799'))
+    return rules.difficulty_start
 
 
 def shipReward():
-    return int(os.getenv('SHIP_REWARD', '10'))
+    return rules.ship_reward
 
 
 def maximumStarLogSize():
-    return int(os.getenv('STARLOGS_MAX_BYTES', '999999'))
+    return rules.star_logs_max_bytes
 
 
 def maximumEventSize():
-    return int(os.getenv('EVENTS_MAX_BYTES', '999999'))
+    return rules.events_max_bytes
 
 
 def cartesianDigits():
-    return int(os.getenv('CARTESIAN_DIGITS', '3'))
+    return rules.cartesian_digits
 
 
 def jumpCostMinimum():
-    return float(os.getenv('JUMP_COST_MIN', '0.01'))
+    return rules.jump_cost_min
 
 
 def jumpCostMaximum():
-    return float(os.getenv('JUMP_COST_MAX', '1.0'))
+    return rules.jump_cost_max
 
 
 def jumpDistanceMaximum():
-    return float(os.getenv('JUMP_DIST_MAX', '2048.0'))
+    return rules.jump_distance_max
 
 
 def starLogsMaxLimit():
-    return int(os.getenv('STARLOGS_MAX_LIMIT', '10'))
+    return rules.star_logs_max_limit
 
 
 def eventsMaxLimit():
-    return int(os.getenv('EVENTS_MAX_LIMIT', '10'))
+    return rules.events_max_limit
 
 
 def chainsMaxLimit():
-    return int(os.getenv('CHAINS_MAX_LIMIT', '10'))
+    return rules.chains_max_limit
+
+
+def starLogsCacheMaxBytes():
+    return rules.star_logs_cache_max_bytes
+
+
+def starLogsBatchMaxCount():
+    return rules.star_logs_batch_max_count
+
+
+def starLogsBatchChunkSize():
+    return rules.star_logs_batch_chunk
+
+
+def rsaWorkers():
+    return rules.rsa_workers
+
+
+def publicKeysCacheMaxEntries():
+    return rules.public_keys_cache_max_entries
+
+
+def verifiedEventsCacheMaxEntries():
+    return rules.verified_events_cache_max_entries
+
+
+def ingestAsync():
+    return rules.ingest_async
+
+
+def ingestBrokerUrl():
+    return rules.ingest_broker_url
+
+
+def ingestQueueDirectory():
+    return rules.ingest_queue_directory
+
+
+def cartesianCacheMaxEntries():
+    return rules.cartesian_cache_max_entries
+
+
+def spatialGridCells():
+    return rules.spatial_grid_cells
+
+
+def spatialGapSeconds():
+    return rules.spatial_gap_seconds
+
+
+def nearbyMaxLimit():
+    return rules.nearby_max_limit
+
+
+def queryRepeatWarning():
+    return rules.query_repeat_warning
 
 
+def metricsDirectory():
+    return rules.metrics_directory
+
+
+rules = load_rules()
+
 MAXIMUM_NONCE = 2147483647
 MAXIMUM_TARGET = '00000000ffffffffffffffffffffffff' \
                  'ffffffffffffffffffffffffffffffff'
 EMPTY_TARGET = '00000000000000000000000000000000' \
                '00000000000000000000000000000000'
+TARGET_MASK = (1 << 256) - 1
+# Star logs of this version commit to their events with a Merkle root instead of a flat hash.
+MERKLE_VERSION = 1
 
 EVENT_TYPES = [
     'unknown',
@@ -88,6 +283,7 @@ SHIP_EVENT_TYPES = [
     'transfer'
 ]
 
+
 def get_maximum_target():
     if difficultyFudge() == 0:
         return MAXIMUM_TARGET
@@ -95,21 +291,6 @@ def get_maximum_target():
         raise Exception('DIFFICULTY_FUDGE must be a value from 0 to 8 (inclusive)')
     return MAXIMUM_TARGET[difficultyFudge():] + MAXIMUM_TARGET[:difficultyFudge()]
 
-if not 3 <= cartesianDigits() <= 21:
-    raise Exception('CARTESIAN_DIGITS must be a value from 3 to 21 (inclusive)')
-
-if not 0 <= jumpCostMinimum() < 1:
-    raise Exception('JUMP_COST_MIN must be a value from 0.0 to 1.0 (inclusive - exclusive)')
-
-if not 0 < jumpCostMaximum() <= 1:
-    raise Exception('JUMP_COST_MAX must be a value from 0.0 to 1.0 (exclusive - inclusive)')
-
-if jumpCostMaximum() <= jumpCostMinimum():
-    raise Exception('JUMP_COST_MIN must be less than JUMP_COST_MAX')
-
-if jumpDistanceMaximum() <= 0:
-    raise Exception('JUMP_DIST_MAX must be greater than 0.0')
-
 
 def is_genesis_star_log(sha):
     """Checks if the provided hash could only belong to the parent of the genesis star log.
@@ -222,14 +403,92 @@ def calculate_difficulty(difficulty, duration):
         duration = difficultyDuration() * 4
 
     limit = long(get_maximum_target(), 16)
-    result = long(unpack_bits(difficulty), 16)
+    result = unpack_target(difficulty)
     result *= duration
     result /= difficultyDuration()
 
     if limit < result:
         result = limit
 
-    return difficulty_from_hex(difficulty_from_target(hex(result)[2:]))
+    return pack_target(result)
+
+
+# Targets of recently seen difficulties, keyed by the packed difficulty and the fudge applied to it.
+target_cache = register_rules_cache(LruCache(1024))
+
+
+def unpack_target(difficulty):
+    """Unpacks int difficulty into the integer value of its target.
+
+    Equal to the value of the hex returned by `unpack_bits`, but calculated
+    with shifts and cached per difficulty.
+
+    Args:
+        difficulty (int): Packed int representation of a difficulty.
+
+    Returns:
+        long: Target a hash must be less than to meet this difficulty.
+    """
+    if not isinstance(difficulty, (int, long)):
+        raise TypeError('difficulty is not int')
+    key = (difficulty, difficultyFudge())
+    target = target_cache.get(key)
+    if target is None:
+        target = _unpack_target(difficulty)
+        target_cache.set(key, target)
+    return target
+
+
+def _unpack_target(difficulty):
+    if not 0x10000000 <= difficulty <= 0xffffffff:
+        # unpack_bits reads the packed hex by position, which only lines up with the bytes of an 8 digit difficulty.
+        return long(unpack_bits(difficulty), 16)
+    exponent = difficulty >> 24
+    if exponent == 29:
+        significant = difficulty & 0xffff
+        significant_count = 2
+    else:
+        significant = difficulty & 0xffffff
+        significant_count = 3
+    target = long(significant) << (8 * (min(exponent, 28) - significant_count))
+    return rotate_target(target)
+
+
+def rotate_target(target):
+    """Applies DIFFICULTY_FUDGE to a target by rotating its hex digits left.
+
+    Args:
+        target (long): Target without any fudge applied.
+
+    Returns:
+        long: The fudged target.
+    """
+    bits = 4 * difficultyFudge()
+    if bits == 0:
+        return target
+    return ((target << bits) | (target >> (256 - bits))) & TARGET_MASK
+
+
+def pack_target(target):
+    """Packs the integer value of a target into its int difficulty.
+
+    Equal to the difficulty returned by `difficulty_from_target`, but calculated with shifts.
+
+    Args:
+        target (long): Target to pack.
+
+    Returns:
+        int: Packed int format of the difficulty.
+    """
+    size = (target.bit_length() + 7) // 8
+    if size < 3:
+        return difficulty_from_hex(difficulty_from_target(hex(long(target))[2:]))
+    mantissa = target >> (8 * (size - 3))
+    # The mantissa is signed, so a set high bit moves into the exponent instead.
+    if 0x7fffff < mantissa:
+        mantissa >>= 8
+        size += 1
+    return int((size << 24) | mantissa)
 
 
 def concat_star_log_header(star_log, include_nonce=True):
@@ -307,7 +566,7 @@ def hash_star_log(star_log):
     Returns:
         dict: Supplied star log with its `events_hash`, `log_header`, and `hash` fields calculated.
     """
-    star_log['events_hash'] = hash_events(star_log['events'])
+    star_log['events_hash'] = hash_events_commitment(star_log['version'], [hash_event(event) for event in star_log['events']])
     star_log['log_header'] = concat_star_log_header(star_log)
     star_log['hash'] = sha256(star_log['log_header'])
     return star_log
@@ -316,16 +575,142 @@ def hash_star_log(star_log):
 def hash_events(events):
     """Hashed value of the provided events.
 
+    The hash of each event is fed to the hasher as it's calculated, rather
+    than building up one string of every hash.
+
     Args:
         events (dict): Json data for the events to be hashed.
 
     Returns:
         str: Sha256 hash of the provided events.
     """
-    concat = ''
-    for event in events:
-        concat += hash_event(event)
-    return sha256(concat)
+    return hash_event_hashes([hash_event(event) for event in events])
+
+
+def hash_event_hashes(event_hashes):
+    """Hashed value of the provided event hashes, the same as `hash_events` on the events they came from.
+
+    Args:
+        event_hashes (list): Sha256 hashes of each event, in order.
+
+    Returns:
+        str: Sha256 hash of the events.
+    """
+    hasher = hashlib.sha256()
+    for event_hash in event_hashes:
+        hasher.update(event_hash)
+    return hasher.hexdigest()
+
+
+def hash_events_commitment(version, event_hashes):
+    """Hashed value of the events of a star log, in the way its version commits to them.
+
+    Args:
+        version (int): Version of the star log.
+        event_hashes (list): Sha256 hashes of each event, in order.
+
+    Returns:
+        str: Merkle root of the events if the version is `MERKLE_VERSION`, otherwise the flat hash of them.
+    """
+    if version == MERKLE_VERSION:
+        return merkle_root(event_hashes)
+    return hash_event_hashes(event_hashes)
+
+
+def merkle_parent(left_hash, right_hash):
+    """Hashed value of two sibling nodes of a Merkle tree.
+
+    Args:
+        left_hash (str): Sha256 hash of the left node.
+        right_hash (str): Sha256 hash of the right node.
+
+    Returns:
+        str: Sha256 hash of their parent.
+    """
+    return hashlib.sha256(left_hash + right_hash).hexdigest()
+
+
+def merkle_levels(leaf_hashes):
+    """Builds every level of a Merkle tree, from the leaves up to the root.
+
+    A node without a sibling is promoted to the next level unchanged, rather
+    than being paired with itself.
+
+    Args:
+        leaf_hashes (list): Sha256 hashes of the leaves, in order.
+
+    Returns:
+        list: Lists of the hashes on each level, the last holding only the root.
+    """
+    levels = [list(leaf_hashes)]
+    while 1 < len(levels[-1]):
+        level = levels[-1]
+        parents = [merkle_parent(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2 == 1:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def merkle_root(leaf_hashes):
+    """Gets the Merkle root of the provided hashes.
+
+    Args:
+        leaf_hashes (list): Sha256 hashes of the leaves, in order.
+
+    Returns:
+        str: Sha256 hash of the root, or the hash of nothing if there are no leaves.
+    """
+    if not leaf_hashes:
+        return sha256('')
+    return merkle_levels(leaf_hashes)[-1][0]
+
+
+def merkle_proof(leaf_hashes, index):
+    """Gets the siblings needed to prove a leaf is in a Merkle tree.
+
+    Args:
+        leaf_hashes (list): Sha256 hashes of the leaves, in order.
+        index (int): Index of the leaf to prove.
+
+    Returns:
+        list: Json of each sibling from the leaf up, with the side of its parent it belongs on.
+    """
+    if index < 0 or len(leaf_hashes) <= index:
+        raise ValueError('index is out of range')
+    proof = []
+    for level in merkle_levels(leaf_hashes)[:-1]:
+        sibling = index + 1 if index % 2 == 0 else index - 1
+        # Promoted nodes have no sibling to hash with on this level.
+        if sibling < len(level):
+            proof.append({
+                'hash': level[sibling],
+                'position': 'right' if index < sibling else 'left'
+            })
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf_hash, proof, root_hash):
+    """Checks if a proof from `merkle_proof` connects a leaf to a Merkle root.
+
+    Args:
+        leaf_hash (str): Sha256 hash of the leaf.
+        proof (list): Json of each sibling from the leaf up.
+        root_hash (str): Sha256 hash of the root.
+
+    Returns:
+        bool: True if the proof leads from the leaf to the root.
+    """
+    current = leaf_hash
+    for sibling in proof:
+        if sibling['position'] == 'left':
+            current = merkle_parent(sibling['hash'], current)
+        elif sibling['position'] == 'right':
+            current = merkle_parent(current, sibling['hash'])
+        else:
+            raise ValueError('position %s is not left or right' % sibling['position'])
+    return current == root_hash
 
 
 def hash_event(event):
@@ -337,7 +722,41 @@ def hash_event(event):
     Returns:
         str: Sha256 hash of the provided event.
     """
-    return sha256(concat_event(event))
+    hasher = hashlib.sha256()
+    update_event(hasher, event)
+    return hasher.hexdigest()
+
+
+def update_event(hasher, event_json):
+    """Feeds the same information `concat_event` returns to a hasher, one piece at a time.
+
+    Args:
+        hasher: Hashlib object to update.
+        event_json (dict): Event to pull the information from.
+    """
+    hasher.update('%s%s%s' % (event_json['fleet_hash'], event_json['fleet_key'], event_json['type']))
+    if event_json['inputs']:
+        for current_input in sorted(event_json['inputs'], key=lambda x: x['index']):
+            hasher.update(current_input['key'])
+    if event_json['outputs']:
+        for current_output in sorted(event_json['outputs'], key=lambda x: x['index']):
+            hasher.update('%s%s%s%s%s' % (current_output['type'], current_output['fleet_hash'], current_output['key'], current_output['star_system'], current_output['count']))
+
+
+def update_star_log_header(hasher, star_log, include_nonce=True):
+    """Feeds the same information `concat_star_log_header` returns to a hasher.
+
+    Without the nonce, copies of the hasher can be finished with each nonce
+    to try, without hashing the rest of the header again.
+
+    Args:
+        hasher: Hashlib object to update.
+        star_log (dict): StarLog to pull the header from.
+        include_nonce (bool): Feeds the nonce if True.
+    """
+    hasher.update(concat_star_log_header(star_log, False))
+    if include_nonce:
+        hasher.update('%s' % star_log['nonce'])
 
 
 def unpack_bits(difficulty, strip=False):
@@ -485,6 +904,28 @@ def get_jump_cost(origin_hash, destination_hash, count=None):
     return scalar if count is None else int(math.ceil(scalar * count))
 
 
+def get_jump_costs(origin_hash, destination_hashes, counts=None):
+    """Gets the jump cost from one system to many others at once, matching `get_jump_cost` for each.
+
+    Args:
+        origin_hash (str): The starting hash of the jumps.
+        destination_hashes (list): The ending hashes of the jumps.
+        counts (list): The number of ships in each jump.
+
+    Returns:
+        numpy.array: The scalar of the ships lost in each jump, or the number of ships lost if counts are provided.
+    """
+    distances = get_distances(origin_hash, destination_hashes).astype(float)
+    max_distance = jumpDistanceMaximum()
+    cost_max = jumpCostMaximum()
+    cost_min = jumpCostMinimum()
+    cost_range = 1.0 - ((1.0 - cost_max) + cost_min)
+    scalars = numpy.where(max_distance <= distances, cost_max, cost_min + (cost_range * numpy.sqrt(numpy.minimum(distances, max_distance) / max_distance)))
+    if counts is None:
+        return scalars
+    return numpy.ceil(scalars * numpy.array(counts, dtype=float)).astype(numpy.int64)
+
+
 def get_cartesian_minimum():
     """Gets the (x, y, z) position of the minimum possible system.
     
@@ -504,6 +945,31 @@ def get_cartesian_maximum():
     return numpy.array([max_value, max_value, max_value])
 
 
+# Positions of systems never change, so they're kept by hash and the number of digits they were calculated with.
+cartesian_cache = register_rules_cache(LruCache(cartesianCacheMaxEntries()), 'cartesian_cache_max_entries')
+
+
+def get_cartesian_tuple(system_hash):
+    """Gets the (x, y, z) position of the specified system, using the cached position when possible.
+
+    Args:
+        system_hash (str): The system's Sha256 hash.
+
+    Returns:
+        tuple: The (x, y, z) position.
+    """
+    digits = cartesianDigits()
+    key = (system_hash, digits)
+    cartesian = cartesian_cache.get(key)
+    if cartesian is None:
+        cartesian_hash = sha256('%s%s' % ('cartesian', system_hash))
+        total_digits = digits * 3
+        cartesian = cartesian_hash[-total_digits:]
+        cartesian = (int(cartesian[:digits], 16), int(cartesian[digits:-digits], 16), int(cartesian[(2*digits):], 16))
+        cartesian_cache.set(key, cartesian)
+    return cartesian
+
+
 def get_cartesian(system_hash):
     """Gets the (x, y, z) position of the specified system.
 
@@ -513,11 +979,21 @@ def get_cartesian(system_hash):
     Returns:
         numpy.array: A list containing the (x, y, z) position.
     """
-    cartesian_hash = sha256('%s%s' % ('cartesian', system_hash))
-    digits = cartesianDigits()
-    total_digits = digits * 3
-    cartesian = cartesian_hash[-total_digits:]
-    return numpy.array([int(cartesian[:digits], 16), int(cartesian[digits:-digits], 16), int(cartesian[(2*digits):], 16)])
+    return numpy.array(get_cartesian_tuple(system_hash))
+
+
+def get_cartesians(system_hashes):
+    """Gets the (x, y, z) positions of many systems at once.
+
+    Args:
+        system_hashes (list): The systems' Sha256 hashes.
+
+    Returns:
+        numpy.array: An (N, 3) array of positions, as int64 unless the positions are too large to fit.
+    """
+    # Positions of 15 digits or less fit in an int64, larger ones are kept as Python longs.
+    dtype = numpy.int64 if cartesianDigits() <= 15 else object
+    return numpy.array([get_cartesian_tuple(system_hash) for system_hash in system_hashes], dtype=dtype).reshape(-1, 3)
 
 
 def get_distance(origin_hash, destination_hash):
@@ -530,9 +1006,68 @@ def get_distance(origin_hash, destination_hash):
     Returns:
         float: The distance between the two systems.
     """
-    origin_pos = get_cartesian(origin_hash)
-    destination_pos = get_cartesian(destination_hash)
-    return int(math.ceil(numpy.linalg.norm(origin_pos - destination_pos)))
+    return get_cartesian_distance(get_cartesian_tuple(origin_hash), get_cartesian_tuple(destination_hash))
+
+
+def get_cartesian_distance(origin_pos, destination_pos):
+    """Gets the distance between two (x, y, z) positions, rounded up the same way as `get_distance`.
+
+    Args:
+        origin_pos (tuple): The origin position.
+        destination_pos (tuple): The destination position.
+
+    Returns:
+        int: The distance between the two positions.
+    """
+    if not is_distance_exact():
+        return int(math.ceil(numpy.linalg.norm(numpy.array(origin_pos) - numpy.array(destination_pos))))
+    squared = sum([(origin - destination) ** 2 for origin, destination in zip(origin_pos, destination_pos)])
+    return int(math.ceil(math.sqrt(squared)))
+
+
+def is_distance_exact():
+    """Checks if squared distances fit in a float without rounding.
+
+    When they do, distances can be calculated in any order and still match
+    numpy.linalg.norm exactly. Otherwise the result depends on how it sums
+    the squares, so it has to be used.
+
+    Returns:
+        bool: True if CARTESIAN_DIGITS is 6 or less.
+    """
+    return cartesianDigits() <= 6
+
+
+def get_distances(origin_hash, destination_hashes):
+    """Gets the distances from one system to many others at once, matching `get_distance` for each.
+
+    Args:
+        origin_hash (str): The origin system's Sha256 hash.
+        destination_hashes (list): The destination systems' Sha256 hashes.
+
+    Returns:
+        numpy.array: The distance to each destination.
+    """
+    return get_distance_matrix([origin_hash], destination_hashes)[0]
+
+
+def get_distance_matrix(origin_hashes, destination_hashes):
+    """Gets the distances between every origin and every destination at once, matching `get_distance` for each.
+
+    Args:
+        origin_hashes (list): The origin systems' Sha256 hashes.
+        destination_hashes (list): The destination systems' Sha256 hashes.
+
+    Returns:
+        numpy.array: An (N, M) array of the distance from each origin to each destination.
+    """
+    if not is_distance_exact():
+        return numpy.array([[get_distance(origin_hash, destination_hash) for destination_hash in destination_hashes] for origin_hash in origin_hashes], dtype=numpy.int64).reshape(len(origin_hashes), len(destination_hashes))
+    origins = get_cartesians(origin_hashes)
+    destinations = get_cartesians(destination_hashes)
+    differences = (origins[:, numpy.newaxis, :] - destinations[numpy.newaxis, :, :]).astype(float)
+    squared = differences ** 2
+    return numpy.ceil(numpy.sqrt(squared[:, :, 0] + squared[:, :, 1] + squared[:, :, 2])).astype(numpy.int64)
 
 
 def get_unique_key():
@@ -599,6 +1134,35 @@ def get_shortened_hash(sha, length=6, strip_zeros=True):
         return sha[:length]
 
 
+def encode_cursor(time, row_id):
+    """Encodes a position in a list ordered by time and id into an opaque cursor.
+
+    Args:
+        time (int): Time of the last row returned.
+        row_id (int): Id of the last row returned.
+
+    Returns:
+        str: Url safe cursor pointing after the provided row.
+    """
+    return base64.urlsafe_b64encode('%s:%s' % (time, row_id))
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor created with `encode_cursor`.
+
+    Args:
+        cursor (str): Cursor to decode.
+
+    Returns:
+        tuple: The time and id the cursor points after.
+    """
+    try:
+        time, row_id = base64.urlsafe_b64decode(str(cursor)).split(':')
+        return int(time), int(row_id)
+    except (TypeError, ValueError):
+        raise ValueError('cursor is invalid')
+
+
 def get_time():
     """UTC time in seconds.
 
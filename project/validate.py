@@ -8,6 +8,11 @@ from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.serialization import load_pem_public_key
 
 import util
+import signatures
+from cache import LruCache
+
+# Fleet keys recur across events and star logs, so their parsed form is cached by the stripped key.
+public_key_cache = util.register_rules_cache(LruCache(util.publicKeysCacheMaxEntries()), 'public_keys_cache_max_entries')
 
 
 def byte_size(limit, target):
@@ -26,6 +31,24 @@ def field_is_sha256(sha, field_name=None):
                         else 'Field %s is not a hash' % field_name)
 
 
+def fleet_public_key(fleet_key):
+    """Gets the parsed form of a fleet key, using the cached one when possible.
+
+    Args:
+        fleet_key (str): Rsa public key without the BEGIN or END sections.
+
+    Returns:
+        RSAPublicKey: The parsed public key.
+    """
+    public_rsa = public_key_cache.get(fleet_key)
+    if public_rsa is None:
+        public_rsa = load_pem_public_key(bytes(util.expand_rsa_public_key(fleet_key)),
+                                         backend=default_backend()
+                                         )
+        public_key_cache.set(fleet_key, public_rsa)
+    return public_rsa
+
+
 def rsa(public_key, signature, message):
     """Verifies an RSA signature.
     Args:
@@ -34,10 +57,20 @@ def rsa(public_key, signature, message):
         its leading 0x stripped.
         message (str): Message that was signed, unhashed.
     """
+    rsa_parsed(load_pem_public_key(bytes(public_key), backend=default_backend()),
+               signature,
+               message)
+
+
+def rsa_parsed(public_rsa, signature, message):
+    """Verifies an RSA signature with an already parsed public key.
+    Args:
+        public_rsa (RSAPublicKey): Public key to verify with.
+        signature (str): Hex value of the signature with
+        its leading 0x stripped.
+        message (str): Message that was signed, unhashed.
+    """
     try:
-        public_rsa = load_pem_public_key(bytes(public_key),
-                                         backend=default_backend()
-                                         )
         hashed = util.sha256(message)
         public_rsa.verify(
             binascii.unhexlify(signature),
@@ -63,9 +96,31 @@ def sha256(sha, message, name=None):
         raise Exception('SHA256 does not match message' if name is None else 'SHA256 of %s does not match hash' % name)
 
 
-def star_log(star_log_json):
+def star_log(star_log_json, pending_signatures=None):
     """Verifies the starlog has all the required fields, and any hashes and signatures match up.
 
+    Checks run cheapest first, so signatures are only checked once
+    everything else has passed.
+
+    Args:
+        star_log_json (dict): Target starlog json.
+        pending_signatures (list): Signatures of the events are appended to
+        this to be verified by the caller if provided, otherwise they are
+        verified before returning.
+    """
+    star_log_header(star_log_json)
+    difficulty(star_log_json['difficulty'], star_log_json['hash'])
+    star_log_signatures = []
+    star_log_events(star_log_json, star_log_signatures)
+    if pending_signatures is None:
+        signatures.verify(star_log_signatures)
+    else:
+        pending_signatures += star_log_signatures
+
+
+def star_log_header(star_log_json):
+    """Verifies the fields of a starlog's header, and that its hash matches them.
+
     Args:
         star_log_json (dict): Target starlog json.
     """
@@ -96,23 +151,35 @@ def star_log(star_log_json):
     field_is_sha256(star_log_json['meta_hash'], 'meta_hash')
     sha256(star_log_json['hash'], util.concat_star_log_header(star_log_json), 'log_header')
     sha256(star_log_json['meta_hash'], star_log_json['meta'], 'meta')
-    if not star_log_json['events_hash'] == util.hash_events(star_log_json['events']):
+
+
+def star_log_events(star_log_json, pending_signatures):
+    """Verifies the events of a starlog and that they match its events_hash, without checking signatures.
+
+    Args:
+        star_log_json (dict): Target starlog json, with a valid header.
+        pending_signatures (list): Signatures of the events are appended to
+        this to be verified by the caller.
+    """
+    events(star_log_json['events'], pending_signatures)
+    # Each event's hash was checked against its contents above, so they don't need to be hashed again.
+    if not star_log_json['events_hash'] == util.hash_events_commitment(star_log_json['version'], [current['hash'] for current in star_log_json['events']]):
         raise Exception('events_hash does not match actual hash')
-    difficulty(star_log_json['difficulty'], star_log_json['hash'])
-    events(star_log_json['events'])
 
 
-def events(events_json):
+def events(events_json, pending_signatures=None):
     """Verifies the state of a star log has all the required fields, and any hashes and signatures match up.
 
     Args:
         events_json (dict): Events json.
+        pending_signatures (list): Signatures are appended to this instead of
+        being verified if provided.
     """
     remaining_ship_rewards = util.shipReward()
     input_keys = []
     output_keys = []
     for current_event in events_json:
-        event(current_event)
+        event(current_event, pending_signatures=pending_signatures)
         if current_event['type'] == 'reward':
             if len(current_event['inputs']) != 0:
                 raise Exception('reward events cannot have inputs')
@@ -183,7 +250,8 @@ def events(events_json):
 def event(event_json,
           require_index=True,
           require_star_system=False,
-          reward_allowed=True):
+          reward_allowed=True,
+          pending_signatures=None):
     """Verifies the fields of an event.
 
     Args:
@@ -191,6 +259,8 @@ def event(event_json,
         require_index (bool): Verifies an integer index is included if True.
         require_star_system (bool): Verifies that every output specifies a
         star system if True.
+        pending_signatures (list): The fleet key, signature, and hash are
+        appended to this instead of being verified if provided.
     """
     if not isinstance(event_json['type'], basestring):
         raise Exception('type is not a string')
@@ -231,9 +301,11 @@ def event(event_json,
 
     field_is_sha256(event_json['fleet_hash'], 'fleet_hash')
     sha256(event_json['fleet_hash'], event_json['fleet_key'], 'fleet_key')
-    rsa(util.expand_rsa_public_key(event_json['fleet_key']),
-        event_json['signature'],
-        event_json['hash'])
+    signature = (event_json['fleet_key'], event_json['signature'], event_json['hash'])
+    if pending_signatures is None:
+        signatures.verify([signature])
+    else:
+        pending_signatures.append(signature)
 
 
 def event_input(input_json):
@@ -282,9 +354,9 @@ def event_rsa(event_json):
         event_json (dict): Event to validate.
     """
     try:
-        rsa(util.expand_rsa_public_key(event_json['fleet_key']),
-            event_json['signature'],
-            util.concat_event(event_json))
+        rsa_parsed(fleet_public_key(event_json['fleet_key']),
+                   event_json['signature'],
+                   util.concat_event(event_json))
     except InvalidSignature:
         raise Exception('Invalid RSA signature')
 
@@ -303,9 +375,8 @@ def difficulty(packed, sha, validate_params=True):
             raise Exception('difficulty is not an int')
         field_is_sha256(sha, 'difficulty target')
 
-    mask = util.unpack_bits(packed, True)
-    leading_zeros = len(mask) - len(mask.lstrip('0'))
-    difficulty_unpacked(mask, leading_zeros, sha, validate_params)
+    if util.unpack_target(packed) <= long(sha, 16):
+        raise Exception('Hash is greater than packed target')
 
 
 def difficulty_unpacked(unpacked_stripped,
@@ -3,5 +3,10 @@
 if [ $NO_GATEWAY == '1' ]; then
 	python project/app.py
 else
+	# Each worker writes its metrics here for /metrics to add up, left over files are from a previous run.
+	if [ -n "$METRICS_DIR" ]; then
+		mkdir -p $METRICS_DIR
+		rm -f $METRICS_DIR/*.json
+	fi
 	`which gunicorn` -w 4 -b 127.0.0.1:5000 app:app
 fi
\ No newline at end of file
@@ -0,0 +1,44 @@
+from project.cache import LruCache
+
+
+class TestLruCache(object):
+
+    def test_get_and_set(self):
+        cache = LruCache(2)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('b', 2) == 2
+        stats = cache.get_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 2
+
+    def test_evicts_least_recently_used(self):
+        cache = LruCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+        assert cache.evictions == 1
+
+    def test_evicts_by_size(self):
+        cache = LruCache(10, len)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        cache.set('c', 'cccc')
+        assert 'a' not in cache
+        assert cache.size == 8
+        cache.set('b', 'b')
+        assert cache.size == 5
+        # Values larger than the whole cache are never stored.
+        cache.set('d', 'd' * 11)
+        assert 'd' not in cache
+        assert len(cache) == 2
+
+    def test_disabled(self):
+        cache = LruCache(0, len)
+        cache.set('a', 'a')
+        assert cache.get('a') is None
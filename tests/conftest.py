@@ -64,3 +64,36 @@ def session(db, request):
 
     request.addfinalizer(teardown)
     return session
+
+
+@pytest.fixture(scope='function')
+def rules(request, monkeypatch):
+    """Sets environment variables and reloads the rules, restoring both after the test."""
+    from project import util
+
+    def set_rules(**variables):
+        for name, value in variables.items():
+            monkeypatch.setenv(name, str(value))
+        return util.reload_rules()
+
+    def teardown():
+        monkeypatch.undo()
+        util.reload_rules()
+
+    request.addfinalizer(teardown)
+    return set_rules
+
+
+@pytest.fixture(scope='function')
+def client(app, db, rules, monkeypatch):
+    """Test client of the service's app, with cheap difficulty so star logs can be mined quickly."""
+    # Routes roll back sessions they've failed with, which the transaction the session fixture wraps tests in can't hold, so these use real commits.
+    monkeypatch.setattr(db, 'session', db.create_scoped_session())
+    # The service's app is created on import, so it's pointed at the test database first.
+    monkeypatch.setenv('DB_HOST', app.config['SQLALCHEMY_DATABASE_URI'])
+    from project import app as service
+    rules(DIFFICULTY_FUDGE=8)
+    yield service.app.test_client()
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from project import generator, util, validate
+
+
+@pytest.fixture(scope='module')
+def keys(tmpdir_factory):
+    path = str(tmpdir_factory.mktemp('keys').join('keys.json'))
+    generator.load_key_pool(path, 2)
+    keys = generator.load_key_pool(path, 3)
+    assert json.load(open(path))[:2] == [{'public_key': public_key, 'private_key': private_key} for public_key, private_key in keys[:2]]
+    return keys
+
+
+@pytest.fixture(autouse=True)
+def fudge(rules):
+    rules(DIFFICULTY_FUDGE=8, DIFFICULTY_INTERVAL=5)
+
+
+class TestChainGenerator(object):
+
+    def test_generate_is_deterministic(self, keys):
+        first = list(generator.ChainGenerator(keys, 7, 5, 0.5, 2).generate(12))
+        second = list(generator.ChainGenerator(keys, 7, 5, 0.5, 2).generate(12))
+        assert [star_log['hash'] for star_log in first] == [star_log['hash'] for star_log in second]
+        assert [star_log['hash'] for star_log in first] != [star_log['hash'] for star_log in generator.ChainGenerator(keys, 8, 5, 0.5, 2).generate(12)]
+
+    def test_star_logs_are_valid(self, keys):
+        star_logs = list(generator.ChainGenerator(keys, 1, 6, 0.3).generate(15))
+        hashes = set()
+        for star_log in star_logs:
+            validate.star_log(star_log)
+            assert star_log['previous_hash'] == util.EMPTY_TARGET or star_log['previous_hash'] in hashes
+            hashes.add(star_log['hash'])
+        assert 15 < len(star_logs)
+        assert set(['reward', 'transfer']) <= set([event['type'] for star_log in star_logs for event in star_log['events']])
@@ -0,0 +1,25 @@
+import pytest
+
+from project import ingest, util
+from project.models import Fleet
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestAddFleets(object):
+
+    def test_add_fleets(self, session, db):
+        existing = Fleet(util.sha256('existing'), None)
+        session.add(existing)
+        session.flush()
+        fleets = ingest.add_fleets(session, [
+            (util.sha256('new'), 'key'),
+            (util.sha256('existing'), 'key'),
+            (util.sha256('new'), None),
+            (util.sha256('output'), None)
+        ])
+        assert sorted(fleets.keys()) == sorted([util.sha256(name) for name in ['new', 'existing', 'output']])
+        assert fleets[util.sha256('existing')].id == existing.id
+        # The first key listed is kept, and existing fleets are left alone.
+        assert fleets[util.sha256('new')].public_key == 'key'
+        assert fleets[util.sha256('existing')].public_key is None
+        assert session.query(Fleet).count() == 3
@@ -0,0 +1,167 @@
+import json
+
+import pytest
+
+from project import generator, ingest, miner
+
+
+class FakeSession(object):
+    """Records the star logs that would be committed, dropping them on rollback."""
+
+    def __init__(self):
+        self.pending = []
+        self.committed = []
+        self.commits = 0
+
+    def commit(self):
+        self.committed += self.pending
+        self.pending = []
+        self.commits += 1
+
+    def rollback(self):
+        self.pending = []
+
+    def begin_nested(self):
+        return FakeSavepoint(self)
+
+
+class FakeSavepoint(object):
+    """Drops the star logs added since it began when rolled back."""
+
+    def __init__(self, session):
+        self.session = session
+        self.start = len(session.pending)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        del self.session.pending[self.start:]
+
+
+def fake_star_log(session, star_log_json, size):
+    if star_log_json['hash'] in session.committed + session.pending:
+        raise ValueError('starlog with hash %s already exists' % star_log_json['hash'])
+    session.pending.append(star_log_json['hash'])
+
+
+def fake_prepare(session, data, pending_signatures, pending_hashes):
+    star_log_json = json.loads(data)
+    if star_log_json.get('invalid'):
+        raise ValueError('invalid')
+    pending_signatures.append(star_log_json.get('signature', 'valid'))
+    star_log_json['events'] = []
+    return star_log_json
+
+
+def fake_verify_groups(groups):
+    return [None if group == ['valid'] else 'Invalid signature' for group in groups]
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    monkeypatch.setattr(ingest, 'star_log', fake_star_log)
+    monkeypatch.setattr(ingest, 'prepare', fake_prepare)
+    monkeypatch.setattr(ingest.signatures, 'verify_groups', fake_verify_groups)
+    monkeypatch.setattr(ingest.signatures, 'load_verified', lambda session, events_json: None)
+
+
+@pytest.mark.usefixtures('fakes')
+class TestStarLogsBatch(object):
+
+    def test_chunks(self):
+        session = FakeSession()
+        results = ingest.star_logs(session, [json.dumps({'hash': str(i)}) for i in range(0, 5)], 2)
+        assert [result['status'] for result in results] == [200] * 5
+        assert session.committed == ['0', '1', '2', '3', '4']
+        assert session.commits == 3
+
+    def test_rejected_star_logs_are_reported(self):
+        session = FakeSession()
+        star_logs = [{'hash': '0'}, {'hash': '1'}, {'hash': '0'}, {'hash': '2', 'invalid': True},
+                     {'hash': '3', 'signature': 'forged'}, {'hash': '3'}]
+        results = ingest.star_logs(session, [json.dumps(current) for current in star_logs], 10)
+        assert [result['status'] for result in results] == [200, 200, 400, 400, 400, 200]
+        assert results[2]['error'] == 'starlog with hash 0 already exists'
+        assert results[3]['error'] == 'invalid'
+        assert results[4]['error'] == 'Invalid signature'
+        # Only the duplicate is rolled back, the star logs accepted before it in the same chunk are kept.
+        assert session.committed == ['0', '1', '3']
+
+    def test_chunk_size_out_of_range(self):
+        with pytest.raises(ValueError):
+            ingest.star_logs(FakeSession(), [], 0)
+
+
+class TestStages(object):
+
+    def test_rejected_stage_is_counted(self):
+        ingest.metrics.reset()
+        with pytest.raises(Exception):
+            ingest.prepare(None, '{"hash": 1}', [])
+        stages = ingest.metrics.get_stages()
+        assert stages['size']['passed'] == 1
+        assert stages['parse']['passed'] == 1
+        assert stages['header']['rejected'] == 1
+        assert 'difficulty' not in stages
+
+
+class TestSplitArray(object):
+
+    def test_items_keep_their_bytes(self):
+        data = ' [ {"b": 1,  "a": [1, 2]},\n{"hash":"x"} ] '
+        assert ingest.split_array(data) == ['{"b": 1,  "a": [1, 2]}', '{"hash":"x"}']
+        assert ingest.split_array('[]') == []
+
+    def test_invalid_arrays(self):
+        for data in ['{}', '[{} {}]', '[{}] {}', '[{},]', '[{}']:
+            with pytest.raises(ValueError):
+                ingest.split_array(data)
+
+
+@pytest.mark.parametrize('ndjson', [True, False])
+class TestBatchRoute(object):
+
+    def post(self, client, star_logs, ndjson, chunk):
+        if ndjson:
+            data = '\n'.join([json.dumps(current) for current in star_logs])
+            content_type = 'application/x-ndjson'
+        else:
+            data = json.dumps(star_logs)
+            content_type = 'application/json'
+        response = client.post('/star-logs/batch?chunk=%s' % chunk, data=data, content_type=content_type)
+        assert response.status_code == 200
+        return json.loads(response.data)
+
+    def get_head(self, client):
+        return json.loads(client.get('/chains?limit=1').data)[0]['hash']
+
+    def generate(self, tmpdir, count):
+        keys = generator.load_key_pool(str(tmpdir.join('keys.json')), 2)
+        chain_generator = generator.ChainGenerator(keys, 7, 3)
+        return chain_generator, list(chain_generator.generate(count))
+
+    def test_dependent_star_logs(self, client, tmpdir, ndjson):
+        _, chain = self.generate(tmpdir, 6)
+        results = self.post(client, chain, ndjson, 4)
+        assert [result['status'] for result in results] == [200] * 6
+        assert [result['hash'] for result in results] == [current['hash'] for current in chain]
+        assert self.get_head(client) == chain[-1]['hash']
+
+    def test_rejected_and_duplicate_star_logs(self, client, tmpdir, ndjson):
+        chain_generator, chain = self.generate(tmpdir, 4)
+        # A sibling of the third star log spending a key that was never created, it passes every check until the ledger has added its chain.
+        unknown = json.loads(json.dumps(chain[2]))
+        unknown['events'] = [chain_generator.create_event(0, 'transfer', [chain_generator.create_key()], [(1, chain_generator.create_key(), None, 1)], 0)]
+        unknown['nonce'] = 0
+        miner.mine(unknown)
+        star_logs = [chain[0], chain[1], unknown, chain[1], chain[2], chain[3]]
+        results = self.post(client, star_logs, ndjson, 10)
+        assert [result['status'] for result in results] == [200, 200, 400, 400, 200, 200]
+        assert results[2]['error'] == 'event %s is not accounted for' % unknown['events'][0]['inputs'][0]['key']
+        assert results[3]['error'] == 'starlog with hash %s already exists' % chain[1]['hash']
+        assert self.get_head(client) == chain[3]['hash']
+
+        results = self.post(client, chain, ndjson, 2)
+        assert [result['status'] for result in results] == [400] * 4
+        assert self.get_head(client) == chain[3]['hash']
@@ -0,0 +1,42 @@
+import pytest
+
+from project import intervals, util
+from project.models import StarLog, ChainIndex, DifficultyInterval
+
+
+def add_star_log(session, previous, height, time, difficulty, interval_start):
+    sha = util.sha256('schedule %s' % height)
+    chain_index = ChainIndex(None, None if previous is None else previous.id, None, None, sha,
+                             util.EMPTY_TARGET if previous is None else previous.hash, height, 0)
+    session.add(chain_index)
+    session.flush()
+    star_log = StarLog(sha, chain_index.id, height, 0, '', 0, chain_index.previous_hash, difficulty, 0,
+                       time, util.sha256(''), None if interval_start is None else interval_start.star_log_id, '', util.sha256(''))
+    session.add(star_log)
+    session.flush()
+    chain_index.star_log_id = star_log.id
+    if interval_start is None:
+        session.add(DifficultyInterval(star_log.id, sha, 0, height, time, difficulty))
+    session.flush()
+    return chain_index
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestSchedule(object):
+
+    def test_schedule(self, session, db, rules):
+        rules(DIFFICULTY_INTERVAL=3)
+        genesis = add_star_log(session, None, 0, 1000, util.difficultyStart(), None)
+        start = session.query(DifficultyInterval).filter_by(hash=genesis.hash).first()
+        first = add_star_log(session, genesis, 1, 1100, util.difficultyStart(), start)
+        second = add_star_log(session, first, 2, 1200, util.difficultyStart(), start)
+
+        result = intervals.schedule(session, first.hash)
+        assert [interval['height'] for interval in result['intervals']] == [0]
+        assert result['next_height'] == 2
+        assert result['next_difficulty'] == util.difficultyStart()
+
+        result = intervals.schedule(session)
+        assert result['hash'] == second.hash
+        assert result['next_difficulty'] == util.calculate_difficulty(util.difficultyStart(), 200)
+        assert intervals.schedule(session, util.sha256('missing')) is None
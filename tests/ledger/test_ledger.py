@@ -0,0 +1,68 @@
+import pytest
+
+from project import ledger, util
+from project.models import ChainIndex
+
+
+def add_chain_index(session, root, chain, height):
+    chain_index = ChainIndex(None if root is None else root.id, None, None, None,
+                             util.sha256('%s %s' % (chain, height)), None,
+                             height, chain)
+    session.add(chain_index)
+    session.flush()
+    return chain_index
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestLedger(object):
+
+    def create_chains(self, session):
+        """Chain 0 runs from height 0 to 3, chain 1 forks off of it at height 1."""
+        genesis = add_chain_index(session, None, 0, 0)
+        main = [genesis] + [add_chain_index(session, genesis, 0, height) for height in range(1, 4)]
+        fork = [add_chain_index(session, main[1], 1, height) for height in range(2, 4)]
+        ledger.add_chain(session, 1, main[1])
+        return main, fork
+
+    def test_get_branch(self, session, db):
+        main, fork = self.create_chains(session)
+        assert ledger.get_branch(session, None) == {}
+        assert ledger.get_branch(session, main[3]) == {0: 3}
+        assert ledger.get_branch(session, fork[1]) == {0: 1, 1: 3}
+        assert ledger.is_on_branch({0: 1, 1: 3}, 0, 1)
+        assert not ledger.is_on_branch({0: 1, 1: 3}, 0, 2)
+        assert not ledger.is_on_branch({0: 1, 1: 3}, 2, 0)
+
+    def test_add_chain(self, session, db):
+        main, fork = self.create_chains(session)
+        # Chain 2 forks off of chain 1, which forks off of chain 0.
+        nested = add_chain_index(session, fork[0], 2, 3)
+        ledger.add_chain(session, 2, fork[0])
+        assert ledger.get_branch(session, nested) == {0: 1, 1: 2, 2: 3}
+        assert ledger.is_ancestor(session, main[1], nested)
+        assert ledger.is_ancestor(session, fork[0], nested)
+        assert not ledger.is_ancestor(session, main[2], nested)
+        assert not ledger.is_ancestor(session, fork[1], nested)
+        assert not ledger.is_ancestor(session, nested, fork[1])
+        assert ledger.is_ancestor(session, main[0], main[3])
+
+    def test_spend(self, session, db):
+        main, fork = self.create_chains(session)
+        key = util.sha256('created on both branches')
+        ledger.create(session, main[1], key)
+        ledger.spend(session, ledger.get_branch(session, main[2]), main[3], key)
+        # Spending on another branch is fine.
+        ledger.spend(session, ledger.get_branch(session, fork[0]), fork[1], key)
+        with pytest.raises(Exception) as error:
+            ledger.spend(session, ledger.get_branch(session, main[3]), main[3], key)
+        assert 'already been used' in str(error.value)
+
+    def test_spend_missing_origin(self, session, db):
+        main, fork = self.create_chains(session)
+        key = util.sha256('created above the fork')
+        ledger.create(session, main[2], key)
+        with pytest.raises(Exception) as error:
+            ledger.spend(session, ledger.get_branch(session, fork[0]), fork[1], key)
+        assert 'valid output' in str(error.value)
+        with pytest.raises(Exception):
+            ledger.spend(session, ledger.get_branch(session, main[1]), main[2], key)
@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+
+from project import metrics
+from project.cache import LruCache
+
+# Far past the default pid_max, so no running process has it.
+EXITED_PID = 2 ** 30
+
+
+@pytest.fixture
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.mark.usefixtures('clean_metrics')
+class TestMetrics(object):
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.observe('cryptoverse_request_seconds', {'route': '/chains', 'method': 'GET'}, 0.02)
+        metrics.observe('cryptoverse_request_seconds', {'route': '/chains', 'method': 'GET'}, 20.0)
+        text = metrics.render([metrics.get_state()])
+        labels = 'method="GET",route="/chains"'
+        assert 'cryptoverse_request_seconds_bucket{%s,le="0.01"} 0' % labels in text
+        assert 'cryptoverse_request_seconds_bucket{%s,le="0.025"} 1' % labels in text
+        assert 'cryptoverse_request_seconds_bucket{%s,le="10.0"} 1' % labels in text
+        assert 'cryptoverse_request_seconds_bucket{%s,le="+Inf"} 2' % labels in text
+        assert 'cryptoverse_request_seconds_count{%s} 2' % labels in text
+
+    def test_rejections_are_counted_by_stage(self):
+        with pytest.raises(ValueError):
+            with metrics.outcome('star_log'):
+                with metrics.stage('header'):
+                    with metrics.stage('parse'):
+                        raise ValueError('invalid')
+        with pytest.raises(ValueError):
+            with metrics.outcome('star_log'):
+                raise ValueError('invalid')
+        with metrics.outcome('star_log'):
+            pass
+        text = metrics.render([metrics.get_state()])
+        assert 'cryptoverse_ingested_total{kind="star_log",reason="parse",result="rejected"} 1' in text
+        assert 'cryptoverse_ingested_total{kind="star_log",reason="other",result="rejected"} 1' in text
+        assert 'cryptoverse_ingested_total{kind="star_log",reason="",result="accepted"} 1' in text
+        assert 'cryptoverse_stage_total{result="rejected",stage="header"} 1' in text
+
+    def test_label_values_are_escaped(self):
+        metrics.increment('cryptoverse_requests_total', {'route': 'a"b\\c\nd'})
+        assert 'cryptoverse_requests_total{route="a\\"b\\\\c\\nd"} 1' in metrics.render([metrics.get_state()])
+
+    def test_processes_are_merged(self, tmpdir):
+        cache = LruCache(10)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        metrics.register_cache('test', cache)
+        metrics.increment('cryptoverse_requests_total', {'route': '/'}, 3)
+        exited = {
+            'pid': EXITED_PID,
+            'counters': [['cryptoverse_requests_total', [['route', '/']], 2], ['cryptoverse_cache_hits_total', [['cache', 'test']], 2]],
+            'histograms': [],
+            'gauges': [['cryptoverse_cache_entries', [['cache', 'test']], 7]]
+        }
+        with open(os.path.join(str(tmpdir), '%s.json' % EXITED_PID), 'w') as state_file:
+            json.dump(exited, state_file)
+
+        text = metrics.render(metrics.collect(str(tmpdir)), [('cryptoverse_chain_height', {}, 12)])
+        assert os.path.exists(os.path.join(str(tmpdir), '%s.json' % os.getpid()))
+        assert 'cryptoverse_requests_total{route="/"} 5' in text
+        assert 'cryptoverse_cache_hit_ratio{cache="test"} 0.75' in text
+        assert 'cryptoverse_cache_entries{cache="test",pid="%s"} 1' % os.getpid() in text
+        assert 'pid="%s"' % EXITED_PID not in text
+        assert 'cryptoverse_chain_height 12' in text
+        assert 'cryptoverse_cache_hits_total{cache="test"} 3' in text
+
+    def test_exited_processes_are_folded(self, tmpdir):
+        directory = str(tmpdir)
+        for pid, count in [(EXITED_PID, 2), (EXITED_PID + 1, 4)]:
+            metrics.write_state(os.path.join(directory, '%s.json' % pid), {
+                'pid': pid,
+                'counters': [['cryptoverse_requests_total', [['route', '/']], count]],
+                'histograms': [['cryptoverse_request_seconds', [['route', '/']], [1] * len(metrics.LATENCY_BUCKETS), 0.5, 1]],
+                'gauges': []
+            })
+        metrics.increment('cryptoverse_requests_total', {'route': '/'})
+
+        for _ in range(0, 2):
+            text = metrics.render(metrics.collect(directory))
+            assert 'cryptoverse_requests_total{route="/"} 7' in text
+            assert 'cryptoverse_request_seconds_count{route="/"} 2' in text
+        assert sorted([name for name in os.listdir(directory) if name.endswith('.json')]) == sorted(['%s.json' % os.getpid(), metrics.EXITED_FILE])
+
+    def test_flush_is_throttled(self, tmpdir):
+        directory = str(tmpdir)
+        path = os.path.join(directory, '%s.json' % os.getpid())
+        metrics.flush(directory)
+        metrics.increment('cryptoverse_requests_total', {'route': '/'})
+        metrics.flush(directory)
+        assert 'cryptoverse_requests_total' not in open(path).read()
+        metrics.flush(directory, True)
+        assert ['cryptoverse_requests_total', [['route', '/']], 1] in json.load(open(path))['counters']
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from project import generator, migrate
+from project.models import EventLedger, Migration, StarLog
+
+
+@pytest.fixture(scope='module')
+def keys(tmpdir_factory):
+    return generator.load_key_pool(str(tmpdir_factory.mktemp('keys').join('keys.json')), 3)
+
+
+def get_ledger(session):
+    return sorted([(entry.key, entry.chain, entry.height, entry.spent) for entry in session.query(EventLedger)])
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestMigrate(object):
+
+    def test_empty_database_is_marked(self, session, db):
+        migrate.check_migrated(session)
+        assert migrate.get_missing_rebuilds(session) == []
+        assert migrate.rebuild_missing(session) == []
+
+    def test_loaded_chain_is_migrated(self, session, db, keys, rules):
+        rules(DIFFICULTY_FUDGE=8)
+        # Loading marks the empty database first, as generator.py load does.
+        migrate.check_migrated(session)
+        generator.load(session, [json.dumps(star_log) for star_log in generator.ChainGenerator(keys, 6, 3).generate(5)])
+        migrate.check_migrated(session)
+        assert migrate.get_missing_rebuilds(session) == []
+
+    def test_partially_filled_ledger_is_rebuilt(self, session, db, keys, rules):
+        rules(DIFFICULTY_FUDGE=8)
+        star_logs = [json.dumps(star_log) for star_log in generator.ChainGenerator(keys, 5, 3).generate(8)]
+        generator.load(session, star_logs)
+        expected = get_ledger(session)
+        assert expected
+        # Star logs accepted into an empty ledger before migrating leave it partially filled.
+        for entry in session.query(EventLedger).order_by(EventLedger.id).limit(len(expected) // 2):
+            session.delete(entry)
+        session.commit()
+
+        with pytest.raises(Exception):
+            migrate.check_migrated(session)
+        changes = migrate.rebuild_missing(session)
+        session.commit()
+        assert 'rebuilt event ledger with %s entries' % len(expected) in changes
+        assert get_ledger(session) == expected
+        assert sorted([name for name, in session.query(Migration.name)]) == sorted([name for name, _ in migrate.REBUILDS])
+        migrate.check_migrated(session)
+        assert migrate.rebuild_missing(session) == []
+        assert session.query(StarLog).count() == 8
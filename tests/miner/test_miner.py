@@ -0,0 +1,57 @@
+import binascii
+
+import pytest
+
+from project import miner, util, validate
+
+
+def create_star_log():
+    return {
+        'version': 0,
+        'previous_hash': util.EMPTY_TARGET,
+        'difficulty': util.difficultyStart(),
+        'nonce': 0,
+        'time': 1496510257,
+        'events': [],
+        'meta': '',
+        'meta_hash': util.sha256('')
+    }
+
+
+def meets_difficulty(star_log):
+    try:
+        validate.difficulty(star_log['difficulty'], star_log['hash'])
+        return True
+    except Exception:
+        return False
+
+
+@pytest.fixture(autouse=True)
+def fudge(rules):
+    rules(DIFFICULTY_FUDGE=8)
+
+
+class TestMiner(object):
+
+    def test_target_digest(self):
+        target_digest = miner.get_target_digest(util.difficultyStart())
+        for i in range(0, 2000):
+            sha = util.sha256('target %s' % i)
+            assert (binascii.unhexlify(sha) < target_digest) == meets_difficulty({'difficulty': util.difficultyStart(), 'hash': sha})
+
+    def test_mine_finds_lowest_nonce(self):
+        star_log = create_star_log()
+        stats = miner.mine(star_log, 1, 7)
+        assert meets_difficulty(star_log)
+        assert stats['hashes'] == star_log['nonce'] + 1
+        assert star_log['hash'] == util.sha256(util.concat_star_log_header(star_log))
+        for nonce in range(0, star_log['nonce']):
+            candidate = dict(create_star_log(), nonce=nonce)
+            assert not meets_difficulty(util.hash_star_log(candidate))
+
+    def test_processes_agree(self):
+        serial = create_star_log()
+        parallel = create_star_log()
+        miner.mine(serial, 1)
+        miner.mine(parallel, 2, 13)
+        assert parallel == serial
@@ -0,0 +1,51 @@
+import pytest
+
+from project import models
+from project.models import StarLog
+
+
+def test_statement_shape_collapses_parameter_lists():
+    first = models.get_statement_shape('SELECT id FROM star_log\n  WHERE hash IN (?, ?, ?)')
+    second = models.get_statement_shape('SELECT id FROM star_log WHERE hash IN (?)')
+    assert first == second == 'SELECT id FROM star_log WHERE hash IN (?)'
+
+
+def test_repeated_shapes_most_first():
+    counter = models.QueryCounter()
+    for _ in range(0, 3):
+        counter.record('SELECT a WHERE b IN (?, ?)', 0.0)
+    for _ in range(0, 2):
+        counter.record('SELECT c', 0.0)
+    counter.record('SELECT d', 0.0)
+    assert counter.count == 6
+    assert counter.get_repeated(1) == [('SELECT a WHERE b IN (?)', 3), ('SELECT c', 2)]
+    assert counter.get_repeated(3) == []
+
+
+def test_repeated_selects_only():
+    counter = models.QueryCounter()
+    for _ in range(0, 3):
+        counter.record('INSERT INTO a VALUES (?, ?)', 0.0)
+        counter.record('select b', 0.0)
+    assert counter.get_repeated(1, True) == [('select b', 3)]
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestQueryCounter(object):
+
+    def test_counts_statements(self, session, db):
+        with models.count_queries() as counter:
+            for _ in range(0, 3):
+                session.query(StarLog).filter_by(hash='missing').first()
+        session.query(StarLog).first()
+        assert counter.count == 3
+        assert 0.0 <= counter.seconds
+        assert counter.get_repeated(2)[0][1] == 3
+
+    def test_nested_counters(self, session, db):
+        with models.count_queries() as outer:
+            session.query(StarLog).first()
+            with models.count_queries() as inner:
+                session.query(StarLog).first()
+        assert outer.count == 2
+        assert inner.count == 1
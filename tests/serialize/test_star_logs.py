@@ -0,0 +1,95 @@
+import json
+
+import pytest
+from sqlalchemy import event
+
+from project import serialize, util
+from project.models import StarLog, Fleet, Event, EventSignature, \
+    EventInput, EventOutput, StarLogEventSignature
+
+
+def add_star_log(session, sha, previous_hash, event_count):
+    star_log = StarLog(sha, None, 0, 0, '', 0, previous_hash, 486604799, 0,
+                       1496510257, util.sha256(sha), None, '', util.sha256(''))
+    session.add(star_log)
+    fleet = Fleet(util.sha256('fleet' + sha), 'key')
+    session.add(fleet)
+    session.flush()
+    for i in range(0, event_count):
+        signature = EventSignature(util.get_event_type_id('reward'), fleet.id,
+                                   util.sha256('%s%s' % (sha, i)), 'sig',
+                                   1496510257, 1)
+        output = Event(util.sha256('output%s%s' % (sha, i)),
+                       util.get_event_type_id('reward'), fleet.id, 1,
+                       star_log.id)
+        session.add_all([signature, output])
+        session.flush()
+        session.add(EventOutput(output.id, signature.id, 0))
+        session.add(EventInput(output.id, signature.id, 0))
+        session.add(StarLogEventSignature(signature.id, star_log.id, i))
+    session.flush()
+    return star_log
+
+
+def count_queries(session, function):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = function()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return result, len(statements)
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestSerializeStarLogs(object):
+
+    def test_empty(self, session, db):
+        assert serialize.star_logs(session, []) == []
+
+    def test_star_logs(self, session, db):
+        first = add_star_log(session, util.sha256('first'), util.EMPTY_TARGET, 2)
+        second = add_star_log(session, util.sha256('second'), first.hash, 1)
+
+        results = serialize.star_logs(session, [second, first])
+
+        assert [result['hash'] for result in results] == [second.hash, first.hash]
+        assert [current['index'] for current in results[1]['events']] == [0, 1]
+        event_json = results[0]['events'][0]
+        assert event_json['type'] == 'reward'
+        assert event_json['fleet_hash'] == util.sha256('fleet' + second.hash)
+        assert event_json['inputs'] == [{'index': 0, 'key': util.sha256('output%s0' % second.hash)}]
+        # Outputs in the star log they were rewarded in are left blank.
+        assert event_json['outputs'][0]['star_system'] is None
+        assert event_json['outputs'][0]['count'] == 1
+
+    def test_query_count_is_constant(self, session, db):
+        small = add_star_log(session, util.sha256('small'), util.EMPTY_TARGET, 1)
+        large = add_star_log(session, util.sha256('large'), util.EMPTY_TARGET, 20)
+
+        _, small_count = count_queries(session, lambda: serialize.star_logs(session, [small]))
+        results, large_count = count_queries(session, lambda: serialize.star_logs(session, [large]))
+
+        assert len(results[0]['events']) == 20
+        assert small_count == large_count
+
+    def test_star_logs_json_is_cached(self, session, db):
+        first = add_star_log(session, util.sha256('cached first'), util.EMPTY_TARGET, 2)
+        second = add_star_log(session, util.sha256('cached second'), first.hash, 1)
+        serialize.star_log_cache.clear()
+
+        expected = json.dumps(serialize.star_logs(session, [second, first]))
+        assert serialize.star_logs_json(session, [second]) == json.dumps(serialize.star_logs(session, [second]))
+        hits = serialize.star_log_cache.hits
+        result, query_count = count_queries(session, lambda: serialize.star_logs_json(session, [second, first]))
+
+        assert result == expected
+        assert serialize.star_log_cache.hits == hits + 1
+        assert first.hash in serialize.star_log_cache
+        _, query_count = count_queries(session, lambda: serialize.star_logs_json(session, [second, first]))
+        assert query_count == 0
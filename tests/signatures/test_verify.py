@@ -0,0 +1,76 @@
+import pytest
+
+from project import signatures, util
+from project.models import Fleet, EventSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+private_key = rsa.generate_private_key(65537, 2048, default_backend())
+PRIVATE_PEM = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption())
+PUBLIC_KEY = ''.join(private_key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).strip().split('\n')[1:-1])
+
+
+def create_signature(message):
+    return PUBLIC_KEY, util.rsa_sign(PRIVATE_PEM, message), message
+
+
+@pytest.fixture(params=['0', '2'])
+def workers(request, rules):
+    rules(RSA_WORKERS=request.param)
+    return int(request.param)
+
+
+class TestVerify(object):
+
+    def test_valid(self, workers):
+        signatures.verify([create_signature(util.sha256(str(i))) for i in range(0, 4)])
+
+    def test_invalid(self, workers):
+        forged = create_signature(util.sha256('forged'))
+        batch = [create_signature(util.sha256(str(i))) for i in range(0, 3)]
+        batch.append((forged[0], forged[1], util.sha256('other')))
+        with pytest.raises(Exception) as error:
+            signatures.verify(batch)
+        assert 'Invalid signature' in str(error.value)
+
+    def test_groups(self, workers):
+        forged = create_signature(util.sha256('forged'))
+        groups = [[create_signature(util.sha256('first'))], [], [(forged[0], forged[1], util.sha256('other'))]]
+        assert signatures.verify_groups(groups) == [None, None, 'Invalid signature']
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestVerifiedCache(object):
+
+    def count_verifications(self, monkeypatch):
+        calls = []
+        verify = signatures._verify
+        monkeypatch.setattr(signatures, '_verify', lambda signature: calls.append(signature) or verify(signature))
+        return calls
+
+    def test_verified_signatures_are_skipped(self, monkeypatch):
+        signatures.verified_cache.clear()
+        calls = self.count_verifications(monkeypatch)
+        signature = create_signature(util.sha256('cached'))
+        signatures.verify([signature])
+        signatures.verify([signature])
+        assert signatures.verify_groups([[signature]]) == [None]
+        assert calls == [signature]
+
+    def test_load_verified(self, session, db, monkeypatch):
+        signatures.verified_cache.clear()
+        calls = self.count_verifications(monkeypatch)
+        fleet_key, signature, sha = create_signature(util.sha256('stored'))
+        fleet = Fleet(util.sha256(fleet_key), fleet_key)
+        session.add(fleet)
+        session.flush()
+        session.add(EventSignature(util.get_event_type_id('transfer'), fleet.id, sha, signature, 0, 0))
+        session.flush()
+
+        signatures.load_verified(session, [{'hash': sha}, {'hash': None}])
+        signatures.verify([(fleet_key, signature, sha)])
+        assert calls == []
+        # A stored hash with a different signature still has to be verified.
+        with pytest.raises(Exception):
+            signatures.verify([(fleet_key, signature[:-2] + '00', sha)])
@@ -0,0 +1,88 @@
+import pytest
+
+from project import spatial, util
+from project.models import StarLog
+
+SYSTEMS = [util.sha256('nearby %s' % i) for i in range(0, 300)]
+
+
+def brute_force(origin, radius, limit):
+    found = [(util.get_distance(origin, other), other) for other in SYSTEMS if other != origin]
+    return sorted([match for match in found if match[0] <= radius])[:limit]
+
+
+@pytest.fixture(params=[1, 4, 16])
+def grid_index(request, rules):
+    rules(SPATIAL_GRID_CELLS=request.param)
+    grid_index = spatial.GridIndex()
+    for system_hash in SYSTEMS:
+        grid_index.add(system_hash)
+    return grid_index
+
+
+class TestGridIndex(object):
+
+    def test_nearby_matches_brute_force(self, grid_index):
+        for origin in SYSTEMS[:20]:
+            for radius, limit in [(0, 5), (300, 10), (1000, 3), (util.jumpDistanceMaximum(), 25), (100000, 400)]:
+                assert grid_index.nearby(origin, radius, limit) == brute_force(origin, radius, limit)
+
+    def test_add_is_idempotent(self, grid_index):
+        grid_index.add(SYSTEMS[0])
+        assert len(grid_index) == len(SYSTEMS)
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestRefresh(object):
+
+    def add_star_log(self, session, sha, star_log_id=None):
+        star_log = StarLog(sha, None, 0, 0, '', 0, util.EMPTY_TARGET, 486604799, 0,
+                           1496510257, util.sha256(''), None, '', util.sha256(''))
+        star_log.id = star_log_id
+        session.add(star_log)
+        session.flush()
+
+    def test_refresh_is_incremental(self, session, db):
+        grid_index = spatial.GridIndex()
+        self.add_star_log(session, SYSTEMS[0])
+        self.add_star_log(session, SYSTEMS[1])
+        assert grid_index.refresh(session) == 2
+        assert grid_index.refresh(session) == 0
+        self.add_star_log(session, SYSTEMS[2])
+        assert grid_index.refresh(session) == 1
+        assert [other for _, other in grid_index.nearby(SYSTEMS[0], 100000, 10)] == [other for _, other in brute_force(SYSTEMS[0], 100000, 400) if other in SYSTEMS[1:3]]
+
+    def test_late_commits_are_found(self, session, db):
+        grid_index = spatial.GridIndex()
+        self.add_star_log(session, SYSTEMS[0], 1)
+        assert grid_index.refresh(session) == 1
+        # Committed ahead of id 2, which was allocated by a transaction still running.
+        self.add_star_log(session, SYSTEMS[1], 3)
+        assert grid_index.refresh(session) == 1
+        assert grid_index.gaps.keys() == [2]
+        self.add_star_log(session, SYSTEMS[2], 2)
+        assert grid_index.refresh(session) == 1
+        assert SYSTEMS[2] in grid_index
+        assert grid_index.gaps == {}
+
+    def test_gaps_expire(self, session, db, rules):
+        rules(SPATIAL_GAP_SECONDS=0)
+        grid_index = spatial.GridIndex()
+        assert grid_index.refresh(session) == 0
+        self.add_star_log(session, SYSTEMS[0], 2)
+        assert grid_index.refresh(session) == 1
+        assert grid_index.gaps.keys() == [1]
+        grid_index.gaps[1] -= 1
+        assert grid_index.refresh(session) == 0
+        assert grid_index.gaps == {}
+
+    def test_first_refresh_records_no_gaps(self, session, db):
+        grid_index = spatial.GridIndex()
+        self.add_star_log(session, SYSTEMS[0], 1)
+        self.add_star_log(session, SYSTEMS[1], 3)
+        self.add_star_log(session, SYSTEMS[2], 4 + spatial.MAXIMUM_GAPS)
+        assert grid_index.refresh(session) == 3
+        assert grid_index.gaps == {}
+        self.add_star_log(session, SYSTEMS[3], 6 + spatial.MAXIMUM_GAPS)
+        assert grid_index.refresh(session) == 1
+        assert grid_index.gaps.keys() == [5 + spatial.MAXIMUM_GAPS]
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from project import generator, tasks
+from project.models import IngestTicket
+
+
+def fail(session):
+    raise ValueError('rejected for testing')
+
+
+@pytest.mark.usefixtures('session', 'db')
+class TestTasks(object):
+
+    def test_enqueue(self, session, db, monkeypatch):
+        queued = []
+        monkeypatch.setattr(tasks.ingest_event, 'delay', lambda *args: queued.append(args))
+        ticket = tasks.enqueue(session, 'event', '{}')
+        assert ticket['status'] == 'pending'
+        assert queued == [(ticket['ticket'], '{}')]
+        assert session.query(IngestTicket).filter_by(ticket=ticket['ticket']).first().kind == 'event'
+
+    def test_enqueue_failed(self, session, db, monkeypatch):
+        monkeypatch.setattr(tasks.ingest_event, 'delay', lambda *args: fail(None))
+        with pytest.raises(ValueError):
+            tasks.enqueue(session, 'event', '{}')
+        match = session.query(IngestTicket).filter_by(kind='event').first()
+        assert match.status == 'failed'
+        assert match.error == 'rejected for testing'
+
+
+@pytest.fixture
+def committed(db, monkeypatch):
+    """A session committing for real, since runs ingest with sessions of their own."""
+    monkeypatch.setattr(db, 'session', db.create_scoped_session())
+    yield db.session
+    db.session.query(IngestTicket).delete()
+    db.session.commit()
+    db.session.remove()
+
+
+class TestRun(object):
+
+    def test_accepted(self, committed):
+        committed.add(IngestTicket('accepted', 'star_log', 'pending', None, 0))
+        committed.commit()
+        calls = []
+        tasks.run('accepted', calls.append)
+        assert len(calls) == 1
+        assert committed.query(IngestTicket).filter_by(ticket='accepted').first().status == 'accepted'
+
+    def test_rejected(self, committed):
+        committed.add(IngestTicket('rejected', 'star_log', 'pending', None, 0))
+        committed.commit()
+        tasks.run('rejected', fail)
+        match = committed.query(IngestTicket).filter_by(ticket='rejected').first()
+        assert match.status == 'rejected'
+        assert match.error == 'rejected for testing'
+
+    def test_caller_session_is_left_open(self, committed):
+        ticket = IngestTicket('open', 'star_log', 'pending', None, 0)
+        committed.add(ticket)
+        committed.commit()
+        tasks.run('open', lambda session: None)
+        assert ticket in committed
+        committed.refresh(ticket)
+        assert ticket.status == 'accepted'
+
+
+@pytest.fixture
+def async_rules(rules):
+    rules(INGEST_ASYNC=1)
+
+
+@pytest.mark.usefixtures('async_rules')
+class TestIngestRoutes(object):
+
+    def post(self, client, data):
+        response = client.post('/star-logs', data=data)
+        assert response.status_code == 202
+        ticket = json.loads(response.data)
+        assert ticket['status'] == 'pending'
+        response = client.get('/ingest/%s' % ticket['ticket'])
+        assert response.status_code == 200
+        return json.loads(response.data)
+
+    def test_accepted(self, client, tmpdir):
+        keys = generator.load_key_pool(str(tmpdir.join('keys.json')), 1)
+        star_log = next(generator.ChainGenerator(keys, 13, 1).generate(1))
+        assert self.post(client, json.dumps(star_log))['status'] == 'accepted'
+        assert json.loads(client.get('/chains?limit=1').data)[0]['hash'] == star_log['hash']
+
+    def test_rejected(self, client):
+        ticket = self.post(client, '{"hash": 1}')
+        assert ticket['status'] == 'rejected'
+        assert ticket['error']
+
+    def test_missing_ticket(self, client):
+        assert client.get('/ingest/missing').status_code == 404
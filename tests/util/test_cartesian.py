@@ -0,0 +1,55 @@
+import math
+
+import numpy
+import pytest
+
+from project import util
+
+
+def numpy_cartesian(system_hash):
+    """get_cartesian as it was done before positions were cached."""
+    cartesian_hash = util.sha256('%s%s' % ('cartesian', system_hash))
+    digits = util.cartesianDigits()
+    cartesian = cartesian_hash[-(digits * 3):]
+    return numpy.array([int(cartesian[:digits], 16), int(cartesian[digits:-digits], 16), int(cartesian[(2 * digits):], 16)])
+
+
+def numpy_distance(origin_hash, destination_hash):
+    """get_distance as it was done with numpy.linalg.norm."""
+    return int(math.ceil(numpy.linalg.norm(numpy_cartesian(origin_hash) - numpy_cartesian(destination_hash))))
+
+
+SYSTEMS = [util.sha256('system %s' % i) for i in range(0, 40)]
+
+
+@pytest.fixture(params=[3, 6, 10, 15])
+def digits(request, rules):
+    rules(CARTESIAN_DIGITS=request.param)
+    return request.param
+
+
+class TestCartesian(object):
+
+    def test_cartesians(self, digits):
+        cartesians = util.get_cartesians(SYSTEMS)
+        assert cartesians.shape == (len(SYSTEMS), 3)
+        for system_hash, cartesian in zip(SYSTEMS, cartesians):
+            assert list(cartesian) == list(numpy_cartesian(system_hash))
+            assert list(util.get_cartesian(system_hash)) == list(cartesian)
+
+    def test_distances(self, digits):
+        matrix = util.get_distance_matrix(SYSTEMS[:10], SYSTEMS)
+        assert matrix.shape == (10, len(SYSTEMS))
+        for i, origin in enumerate(SYSTEMS[:10]):
+            expected = [numpy_distance(origin, destination) for destination in SYSTEMS]
+            assert [util.get_distance(origin, destination) for destination in SYSTEMS] == expected
+            assert list(util.get_distances(origin, SYSTEMS)) == expected
+            assert list(matrix[i]) == expected
+
+    def test_jump_costs(self):
+        counts = range(1, len(SYSTEMS) + 1)
+        costs = util.get_jump_costs(SYSTEMS[0], SYSTEMS, counts)
+        scalars = util.get_jump_costs(SYSTEMS[0], SYSTEMS)
+        for destination, count, cost, scalar in zip(SYSTEMS, counts, costs, scalars):
+            assert cost == util.get_jump_cost(SYSTEMS[0], destination, count)
+            assert scalar == util.get_jump_cost(SYSTEMS[0], destination)
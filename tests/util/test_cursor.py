@@ -0,0 +1,14 @@
+from unittest import TestCase
+
+
+class TestCursor(TestCase):
+    def test_round_trip(self):
+        from project import util
+        cursor = util.encode_cursor(1496510257, 42)
+        assert util.decode_cursor(cursor) == (1496510257, 42)
+
+    def test_invalid(self):
+        from project import util
+        for cursor in ['', 'not a cursor', util.encode_cursor('time', 1)]:
+            with self.assertRaises(ValueError):
+                util.decode_cursor(cursor)
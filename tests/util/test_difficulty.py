@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from project import util, validate
+
+
+def string_calculate_difficulty(difficulty, duration):
+    """calculate_difficulty as it was done with hex strings."""
+    duration = min(max(duration, util.difficultyDuration() / 4), util.difficultyDuration() * 4)
+    limit = long(util.get_maximum_target(), 16)
+    result = long(util.unpack_bits(difficulty), 16) * duration / util.difficultyDuration()
+    return util.difficulty_from_hex(util.difficulty_from_target(hex(min(limit, result))[2:]))
+
+
+def string_meets_difficulty(difficulty, sha):
+    """validate.difficulty as it was done with hex strings."""
+    mask = util.unpack_bits(difficulty, True)
+    try:
+        validate.difficulty_unpacked(mask, len(mask) - len(mask.lstrip('0')), sha)
+    except Exception:
+        return False
+    return True
+
+
+def chain_difficulties(count, seed):
+    """Difficulties of a chain retargeting after intervals of random durations."""
+    generator = random.Random(seed)
+    difficulties = [util.difficultyStart()]
+    for _ in range(0, count):
+        duration = int(util.difficultyDuration() * generator.uniform(0.1, 5.0))
+        difficulties.append(string_calculate_difficulty(difficulties[-1], duration))
+    return difficulties
+
+
+@pytest.fixture(params=[0, 1, 4, 8])
+def fudge(request, rules):
+    rules(DIFFICULTY_FUDGE=request.param)
+    return request.param
+
+
+class TestDifficulty(object):
+
+    def test_unpack_target(self, fudge):
+        for difficulty in chain_difficulties(200, fudge) + [0x1d00ffff, 0x1c00ffff, 0x1e7fffff, 0x20123456, 0x10800000]:
+            assert util.unpack_target(difficulty) == long(util.unpack_bits(difficulty), 16)
+
+    def test_pack_target(self):
+        generator = random.Random(0)
+        for bits in range(17, 257):
+            target = generator.getrandbits(bits) | (1L << (bits - 1))
+            assert util.pack_target(target) == util.difficulty_from_hex(util.difficulty_from_target(hex(target)[2:]))
+
+    def test_calculate_difficulty(self, fudge):
+        difficulties = chain_difficulties(200, fudge)
+        generator = random.Random(fudge)
+        for difficulty in difficulties:
+            duration = int(util.difficultyDuration() * generator.uniform(0.1, 5.0))
+            assert util.calculate_difficulty(difficulty, duration) == string_calculate_difficulty(difficulty, duration)
+
+    def test_meets_difficulty(self, fudge):
+        generator = random.Random(fudge)
+        for difficulty in chain_difficulties(50, fudge):
+            target = util.unpack_target(difficulty)
+            shas = ['%064x' % value for value in [0, target - 1, target, target + 1, util.TARGET_MASK]]
+            shas += ['%064x' % generator.randint(0, min(util.TARGET_MASK, target * 2)) for _ in range(0, 20)]
+            for sha in shas:
+                met = True
+                try:
+                    validate.difficulty(difficulty, sha)
+                except Exception:
+                    met = False
+                assert met == string_meets_difficulty(difficulty, sha)
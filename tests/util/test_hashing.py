@@ -0,0 +1,93 @@
+import hashlib
+import random
+
+import pytest
+
+from project import util
+
+
+def string_hash_events(events):
+    """hash_events as it was done by concatenating every event hash."""
+    concat = ''
+    for event in events:
+        concat += util.sha256(util.concat_event(event))
+    return util.sha256(concat)
+
+
+def random_value(generator):
+    return generator.choice([
+        util.sha256(str(generator.random())),
+        unicode(util.sha256(str(generator.random()))),
+        generator.randint(0, 2 ** 40),
+        None,
+        '',
+        'transfer'
+    ])
+
+
+def random_event(generator):
+    inputs = [{'index': index, 'key': util.sha256(str(generator.random()))} for index in range(0, generator.randint(0, 4))]
+    outputs = [
+        {
+            'index': index,
+            'type': random_value(generator),
+            'fleet_hash': random_value(generator),
+            'key': random_value(generator),
+            'star_system': random_value(generator),
+            'count': random_value(generator)
+        }
+        for index in range(0, generator.randint(0, 4))
+    ]
+    # Indices are sorted before hashing, so they shouldn't need to arrive in order.
+    generator.shuffle(inputs)
+    generator.shuffle(outputs)
+    return {
+        'fleet_hash': random_value(generator),
+        'fleet_key': random_value(generator),
+        'type': random_value(generator),
+        'inputs': inputs if inputs or generator.random() < 0.5 else None,
+        'outputs': outputs if outputs or generator.random() < 0.5 else None
+    }
+
+
+@pytest.fixture(params=range(0, 5))
+def generator(request):
+    return random.Random(request.param)
+
+
+class TestHashing(object):
+
+    def test_hash_event(self, generator):
+        for _ in range(0, 200):
+            event = random_event(generator)
+            assert util.hash_event(event) == util.sha256(util.concat_event(event))
+
+    def test_hash_events(self, generator):
+        for count in [0, 1, 2, 50]:
+            events = [random_event(generator) for _ in range(0, count)]
+            assert util.hash_events(events) == string_hash_events(events)
+            assert util.hash_event_hashes([util.hash_event(event) for event in events]) == string_hash_events(events)
+
+    def test_update_star_log_header(self, generator):
+        star_log = {
+            'version': 0,
+            'previous_hash': util.sha256(str(generator.random())),
+            'difficulty': generator.randint(0, util.MAXIMUM_NONCE),
+            'events_hash': util.sha256(str(generator.random())),
+            'meta_hash': util.sha256(''),
+            'time': generator.randint(0, 2 ** 32),
+            'nonce': generator.randint(0, util.MAXIMUM_NONCE)
+        }
+        hasher = hashlib.sha256()
+        util.update_star_log_header(hasher, star_log)
+        assert hasher.hexdigest() == util.sha256(util.concat_star_log_header(star_log))
+        hasher = hashlib.sha256()
+        util.update_star_log_header(hasher, star_log, False)
+        assert hasher.hexdigest() == util.sha256(util.concat_star_log_header(star_log, False))
+
+    def test_unencodable_event_is_rejected(self):
+        event = {'fleet_hash': u'\xe9', 'fleet_key': '', 'type': 'reward', 'inputs': None, 'outputs': None}
+        with pytest.raises(UnicodeEncodeError):
+            util.sha256(util.concat_event(event))
+        with pytest.raises(UnicodeEncodeError):
+            util.hash_event(event)
@@ -0,0 +1,36 @@
+import pytest
+
+from project import util
+
+LEAVES = [util.sha256('leaf %s' % i) for i in range(0, 17)]
+
+
+class TestMerkle(object):
+
+    def test_merkle_root(self):
+        assert util.merkle_root([]) == util.sha256('')
+        assert util.merkle_root(LEAVES[:1]) == LEAVES[0]
+        assert util.merkle_root(LEAVES[:2]) == util.sha256(LEAVES[0] + LEAVES[1])
+        # The odd leaf is promoted, not paired with itself.
+        assert util.merkle_root(LEAVES[:3]) == util.sha256(util.sha256(LEAVES[0] + LEAVES[1]) + LEAVES[2])
+
+    def test_proofs(self):
+        for count in range(1, len(LEAVES) + 1):
+            leaves = LEAVES[:count]
+            root = util.merkle_root(leaves)
+            for index, leaf in enumerate(leaves):
+                proof = util.merkle_proof(leaves, index)
+                assert len(proof) <= (count - 1).bit_length()
+                assert util.verify_merkle_proof(leaf, proof, root)
+                assert not util.verify_merkle_proof(util.sha256('other'), proof, root)
+                if proof:
+                    proof[0]['position'] = 'left' if proof[0]['position'] == 'right' else 'right'
+                    assert not util.verify_merkle_proof(leaf, proof, root)
+
+    def test_proof_index_out_of_range(self):
+        with pytest.raises(ValueError):
+            util.merkle_proof(LEAVES, len(LEAVES))
+
+    def test_events_commitment(self):
+        assert util.hash_events_commitment(0, LEAVES) == util.hash_event_hashes(LEAVES)
+        assert util.hash_events_commitment(util.MERKLE_VERSION, LEAVES) == util.merkle_root(LEAVES)
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from project import serialize, util
+
+
+class TestRules(object):
+
+    def test_rules_are_read_once(self, rules):
+        snapshot = rules(SHIP_REWARD=20)
+        os.environ['SHIP_REWARD'] = '30'
+        assert util.shipReward() == 20
+        assert util.rules is snapshot
+        assert util.reload_rules().ship_reward == 30
+
+    def test_fingerprint_covers_public_rules(self, rules):
+        default = util.rules.fingerprint
+        assert rules(STARLOGS_CACHE_MAX_BYTES=1024).fingerprint == default
+        assert rules(DIFFICULTY_FUDGE=4).fingerprint != default
+
+    def test_rules_json(self, rules):
+        rules(JUMP_DIST_MAX='512.5')
+        result = util.get_rules_json()
+        assert result['jump_distance_max'] == 512.5
+        assert result['fingerprint'] == util.rules.fingerprint
+        assert sorted(result.keys()) == sorted(util.PUBLIC_RULES + ['fingerprint'])
+
+    def test_reloaded_rules_are_checked(self, rules):
+        snapshot = util.rules
+        with pytest.raises(Exception):
+            rules(CARTESIAN_DIGITS=2)
+        with pytest.raises(Exception):
+            rules(JUMP_COST_MIN='0.5', JUMP_COST_MAX='0.5')
+        assert util.rules is snapshot
+
+    def test_reload_resizes_caches(self, rules):
+        serialize.star_log_cache.set('hash', 'json')
+        rules(STARLOGS_CACHE_MAX_BYTES=1024)
+        assert 'hash' not in serialize.star_log_cache
+        assert serialize.star_log_cache.maximum == 1024
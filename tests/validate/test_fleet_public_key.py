@@ -0,0 +1,19 @@
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from project import validate
+
+public_pem = rsa.generate_private_key(65537, 2048, default_backend()).public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+FLEET_KEY = ''.join(public_pem.strip().split('\n')[1:-1])
+
+
+class TestFleetPublicKey(object):
+
+    def test_cached(self):
+        validate.public_key_cache.clear()
+        hits = validate.public_key_cache.hits
+        first = validate.fleet_public_key(FLEET_KEY)
+        assert validate.fleet_public_key(FLEET_KEY) is first
+        assert validate.public_key_cache.hits == hits + 1
+        assert FLEET_KEY in validate.public_key_cache